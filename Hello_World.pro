@@ -1,3 +1,5 @@
 TEMPLATE = app
 
-SOURCES += src/main.cpp SConstruct helpers.py wrappers.py
+HEADERS += src/precompiled.hpp
+
+SOURCES += src/main.cpp SConstruct helpers.py wrappers.py tracing.py compile_broker.py probes.py
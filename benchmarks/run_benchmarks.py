@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Benchmarks for the real SConstruct (with helpers.py and wrappers.py)
+on synthetic projects.
+
+For each number of translation units (1, 100 and 1000 by default) and for each
+argument style of the supported OSes (DESTDIR, install_root, BUILDROOT), a project
+is generated in a temporary directory, and these runs are timed:
+
+- cold: the first build;
+- noop: the same build again (nothing to do);
+- touch: the build after changing one source file;
+- install: the build with "INSTALL=1";
+- clean: scons -c;
+- single: the first build and install in one run ("INSTALL=1 SINGLE_PASS=1"),
+  then scons -c again (not timed).
+
+The results are written to a JSON file (bench_results.json by default) together
+with the current commit, so that they can be compared across commits.
+
+Examples:
+python benchmarks/run_benchmarks.py
+python benchmarks/run_benchmarks.py --sizes 1,100 --styles gentoo --jobs 8 --repeat 3
+python benchmarks/run_benchmarks.py --extra-args "BUILD_CACHE=/tmp/bench_cache"
+python benchmarks/run_benchmarks.py --modes default,incremental,unity
+"""
+
+import argparse
+import json
+import os
+import os.path
+import platform
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# ========== DATA ==========
+
+# The files of the helper that are copied to every generated project
+PROJECT_FILES = ['SConstruct', 'helpers.py', 'wrappers.py', 'tracing.py', 'compile_broker.py', 'probes.py', \
+                    'install_manifest.json']
+PROJECT_DIRS = ['profiles', 'docs']
+# The prefix headers (see 'prefix_headers' in SConstruct)
+PROJECT_HEADERS = ['src/precompiled.hpp']
+
+# Install-related arguments of each OS (see the profiles)
+STYLES = {
+    'gentoo' : ['DESTDIR={image}', 'PREFIX=/usr'],
+    'debian-based' : ['install_root={image}', 'prefix=/usr'],
+    'rpm-based' : ['BUILDROOT={image}', 'PREFIX=/usr']
+}
+
+COMPILE_ARGUMENTS = ['CXX=g++', 'CXXFLAGS=-O2 -g', 'LDFLAGS=-Wl,-O1']
+
+STEPS = ['cold', 'noop', 'touch', 'install', 'clean', 'single']
+
+# More ARGUMENTS for each mode of the helper
+MODES = {
+    'default' : [],
+    'incremental' : ['INCREMENTAL=1'],
+    'unity' : ['UNITY=auto']
+}
+
+# ========== FUNCTIONS ==========
+
+def get_repo_dir():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def get_commit(repo_dir):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = repo_dir, \
+                            capture_output = True, text = True, check = True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], \
+                            cwd = repo_dir, capture_output = True, text = True, check = True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    if dirty:
+        commit += '-dirty'
+    return commit
+
+def generate_project(repo_dir, project_dir, sources):
+    for project_file in PROJECT_FILES:
+        shutil.copy2(os.path.join(repo_dir, project_file), project_dir)
+    for project_subdir in PROJECT_DIRS:
+        shutil.copytree(os.path.join(repo_dir, project_subdir), os.path.join(project_dir, project_subdir))
+    src_dir = os.path.join(project_dir, 'src')
+    os.mkdir(src_dir)
+    for project_header in PROJECT_HEADERS:
+        shutil.copy2(os.path.join(repo_dir, project_header), src_dir)
+    with open(os.path.join(src_dir, 'main.cpp'), 'w') as source:
+        source.write('#include <iostream>\n\nint main()\n{\n' + \
+                        '    std::cout << "Hello World!" << std::endl;\n    return 0;\n}\n')
+    # main.cpp is the first translation unit
+    for number in range(1, sources):
+        with open(os.path.join(src_dir, 'unit_%04d.cpp' % number), 'w') as source:
+            source.write('#include <string>\n#include <vector>\n\n' + \
+                            'std::size_t unit_%04d(const std::vector<std::string> &strings)\n' % number + \
+                            '{\n    std::size_t size = 0;\n' + \
+                            '    for (const auto &item : strings)\n        size += item.size();\n' + \
+                            '    return size + %d;\n}\n' % number)
+
+def touch_one_source(project_dir):
+    # The content is changed (not only mtime), as SCons compares contents by default
+    with open(os.path.join(project_dir, 'src', 'main.cpp'), 'a') as source:
+        source.write('// touched at %f\n' % time.time())
+
+def run_scons(project_dir, scons_args):
+    started = time.perf_counter()
+    completed = subprocess.run(scons_args, cwd = project_dir, capture_output = True, text = True)
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        print(completed.stdout)
+        print(completed.stderr)
+        sys.exit('run_scons ERROR: ' + ' '.join(scons_args) + ' failed')
+    return elapsed
+
+def benchmark_project(options, repo_dir, sources, style, mode):
+    results = []
+    with tempfile.TemporaryDirectory(prefix = 'hello-world-bench-') as project_dir:
+        generate_project(repo_dir, project_dir, sources)
+        image = os.path.join(project_dir, 'image')
+        scons = [options.scons, '-j' + str(options.jobs)]
+        arguments = [argument.format(image = image) for argument in STYLES[style]] + \
+                        COMPILE_ARGUMENTS + MODES[mode] + shlex.split(options.extra_args)
+        steps = {
+            'cold' : scons + arguments,
+            'noop' : scons + arguments,
+            'touch' : scons + arguments,
+            'install' : scons + arguments + ['INSTALL=1'],
+            'clean' : scons + ['-c'] + shlex.split(options.extra_args),
+            'single' : scons + arguments + ['INSTALL=1', 'SINGLE_PASS=1']
+        }
+        for repeat in range(options.repeat):
+            for step in STEPS:
+                if step == 'touch':
+                    touch_one_source(project_dir)
+                seconds = run_scons(project_dir, steps[step])
+                if step == 'single':
+                    run_scons(project_dir, steps['clean'])
+                print('%5d sources, %-12s %-11s %-8s %8.3f s' % (sources, style, mode, step, seconds))
+                results.append({'sources' : sources, 'style' : style, 'mode' : mode, 'step' : step, \
+                                    'repeat' : repeat, 'seconds' : round(seconds, 4)})
+    return results
+
+def parse_options():
+    parser = argparse.ArgumentParser(description = 'Benchmarks for SConstruct on synthetic projects')
+    parser.add_argument('--sizes', default = '1,100,1000', \
+                        help = 'numbers of translation units, comma-separated (default: 1,100,1000)')
+    parser.add_argument('--styles', default = ','.join(STYLES), \
+                        help = 'argument styles, comma-separated (default: ' + ','.join(STYLES) + ')')
+    parser.add_argument('--modes', default = 'default', \
+                        help = 'modes of the helper, comma-separated: ' + ', '.join(MODES) + ' (default: default)')
+    parser.add_argument('--jobs', type = int, default = os.cpu_count() or 1, \
+                        help = 'scons -j value (default: number of CPUs)')
+    parser.add_argument('--repeat', type = int, default = 1, help = 'number of repetitions (default: 1)')
+    parser.add_argument('--scons', default = 'scons', help = 'scons executable (default: scons)')
+    parser.add_argument('--extra-args', default = '', \
+                        help = 'more scons ARGUMENTS for every run, like "BUILD_CACHE=/tmp/cache"')
+    parser.add_argument('--output', default = 'bench_results.json', \
+                        help = 'file to write the results to (default: bench_results.json)')
+    options = parser.parse_args()
+    for style in options.styles.split(','):
+        if style not in STYLES:
+            parser.error('unknown style ' + style)
+    for mode in options.modes.split(','):
+        if mode not in MODES:
+            parser.error('unknown mode ' + mode)
+    return options
+
+def main():
+    options = parse_options()
+    repo_dir = get_repo_dir()
+    results = []
+    for sources in [int(size) for size in options.sizes.split(',')]:
+        for style in options.styles.split(','):
+            for mode in options.modes.split(','):
+                results += benchmark_project(options, repo_dir, sources, style, mode)
+    report = {
+        'commit' : get_commit(repo_dir),
+        'date' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'host' : platform.node(),
+        'python' : platform.python_version(),
+        'jobs' : options.jobs,
+        'extra_args' : options.extra_args,
+        'results' : results
+    }
+    with open(options.output, 'w') as output:
+        json.dump(report, output, indent = 1)
+    print('results written to ' + options.output)
+
+if __name__ == '__main__':
+    main()
@@ -50,6 +50,7 @@ scons-3 -c
 
 %files
 %{_bindir}/%{_binary_name}
+%{_mandir}/man1/%{_binary_name}.1*
 %doc README.md
 %doc docs/ToDo
 %doc docs/used_sources
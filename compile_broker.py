@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+A local compile broker: a daemon on a Unix socket that runs the compile
+commands of all the SCons processes on the host (for example, of the
+Debian, RPM and Gentoo builds running at the same time), so that:
+
+- no more than --jobs compilers run at once, whatever 'scons -jN' each
+build uses;
+- identical compilations in flight (the same preprocessed input and
+the same flags) are done once, the others get a copy of the object
+(but not with -gsplit-dwarf, as the object refers to its own .dwo file).
+
+Start it:
+python compile_broker.py --socket /tmp/compile-broker.sock --jobs 8
+and pass COMPILE_BROKER=/tmp/compile-broker.sock IN ARGUMENTS to scons
+(see helpers.py). If the broker is not running, scons compiles directly.
+
+Queue depth and latencies:
+python compile_broker.py --socket /tmp/compile-broker.sock --stats
+
+The socket is accessible to its owner only, as the broker runs the commands
+it gets.
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import os
+import os.path
+import shlex
+import shutil
+import socket
+import socketserver
+import subprocess
+import threading
+import time
+
+def compile_broker_class(socket_path, jobs):
+    int_data = _internal_data(socket_path, jobs)
+
+    ext_methods = {
+        'serve' : lambda: serve(int_data),
+        'get_stats' : lambda: get_stats(int_data)
+    }
+    return ext_methods
+
+def broker_client_class(socket_path):
+    int_data = {'socket_path' : socket_path}
+
+    ext_methods = {
+        'compile' : lambda *args: request_compile(int_data, args[0], args[1], args[2]),
+        'get_stats' : lambda: request_stats(int_data)
+    }
+    return ext_methods
+
+# ========== ALL THE FUNCTIONS BELOW ARE NOT INTENDED TO BE IMPORTED ==========
+
+# ========== CLIENT METHODS ==========
+
+# Internal method
+# One request (a JSON line) and one response (a JSON line) per connection;
+# returns None if the broker is not running
+def _send_request(int_data, request):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(int_data['socket_path'])
+            connection.sendall((json.dumps(request) + '\n').encode('utf-8'))
+            connection.shutdown(socket.SHUT_WR)
+            with connection.makefile('r', encoding = 'utf-8') as response_file:
+                response = response_file.readline()
+    except OSError:
+        return None
+    if not response:
+        return None
+    return json.loads(response)
+
+# External method
+# args are the arguments of a compile command (as SCons spawns them, that is, for sh -c);
+# returns a dictionary with 'returncode', 'stdout' and 'stderr', or None
+def request_compile(int_data, args, cwd, env):
+    return _send_request(int_data, {'op' : 'compile', 'args' : args, 'cwd' : cwd, 'env' : env})
+
+# External method
+def request_stats(int_data):
+    return _send_request(int_data, {'op' : 'stats'})
+
+# ========== SERVER METHODS ==========
+
+# External method
+def serve(int_data):
+    _remove_stale_socket(int_data)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            _handle(int_data, self.rfile, self.wfile)
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    # The socket is created accessible to its owner only (changing its mode after bind
+    # would leave a moment when anybody can connect)
+    umask = os.umask(0o077)
+    try:
+        server = Server(int_data['socket_path'], Handler)
+    finally:
+        os.umask(umask)
+    os.chmod(int_data['socket_path'], 0o600)
+    print('compile broker: listening on ' + int_data['socket_path'] + ', ' + \
+                    str(int_data['jobs']) + ' compile jobs at once')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(int_data['socket_path'])
+
+# Internal method
+# A socket left by a broker that is not running anymore
+def _remove_stale_socket(int_data):
+    if not os.path.exists(int_data['socket_path']):
+        return
+    if _send_request(int_data, {'op' : 'stats'}) is not None:
+        raise SystemExit('serve ERROR: a broker is already running on ' + int_data['socket_path'])
+    os.unlink(int_data['socket_path'])
+
+# Internal method
+def _handle(int_data, rfile, wfile):
+    request = json.loads(rfile.readline().decode('utf-8'))
+    if request.get('op') == 'compile':
+        response = _compile(int_data, request)
+    elif request.get('op') == 'stats':
+        response = get_stats(int_data)
+    else:
+        response = {'error' : 'unknown op'}
+    wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+# Internal method
+# The command is run as SCons runs it (sh -c)
+def _run(request, args):
+    completed = subprocess.run(['/bin/sh', '-c', ' '.join(args)], cwd = request['cwd'], \
+                                    env = request['env'], capture_output = True, text = True)
+    return {'returncode' : completed.returncode, 'stdout' : completed.stdout, 'stderr' : completed.stderr}
+
+# Internal method
+# The arguments are escaped for sh (SCons quotes them)
+def _get_unescaped_args(request):
+    return shlex.split(' '.join(request['args']))
+
+# Internal method
+def _get_output_file(request):
+    args = _get_unescaped_args(request)
+    return os.path.join(request['cwd'], args[args.index('-o') + 1])
+
+# Internal method
+# The hash of the preprocessed input and of the flags (without the output file);
+# the directory matters too when it gets into the object (debug info, profiles)
+def _get_compile_key(int_data, request):
+    args = _get_unescaped_args(request)
+    output_index = args.index('-o')
+    del args[output_index:output_index + 2]
+    # Precompiled headers are not the same even for the same header and flags;
+    # without -fpch-preprocess, -E reads the prefix headers themselves instead
+    preprocessed = subprocess.run(args + ['-E'], cwd = request['cwd'], env = request['env'], \
+                                    capture_output = True)
+    if preprocessed.returncode != 0:
+        return None
+    key = hashlib.sha256(json.dumps(args).encode('utf-8'))
+    key.update(preprocessed.stdout)
+    if any([arg.startswith(int_data['cwd_dependent_flags']) for arg in args]):
+        key.update(request['cwd'].encode('utf-8'))
+    if any([arg.startswith(int_data['output_dependent_flags']) for arg in args]):
+        key.update(_get_output_file(request).encode('utf-8'))
+    return key.hexdigest()
+
+# Internal method
+# Jobs are given in the order they are asked for, so that one build
+# doesn't take all of them from the others
+def _acquire_job(int_data):
+    with int_data['lock']:
+        if int_data['free_jobs'] and not int_data['queue']:
+            int_data['free_jobs'] -= 1
+            return
+        turn = threading.Event()
+        int_data['queue'].append(turn)
+    turn.wait()
+
+# Internal method
+def _release_job(int_data):
+    with int_data['lock']:
+        if int_data['queue']:
+            # The job is handed over to the first one in the queue
+            int_data['queue'].popleft().set()
+        else:
+            int_data['free_jobs'] += 1
+
+# Internal method
+# Runs func when one of the jobs is free; returns its result and the time waited
+def _run_in_job(int_data, func):
+    started = time.perf_counter()
+    _acquire_job(int_data)
+    waited = time.perf_counter() - started
+    with int_data['lock']:
+        int_data['stats']['running'] += 1
+    try:
+        return func(), waited
+    finally:
+        with int_data['lock']:
+            int_data['stats']['running'] -= 1
+        _release_job(int_data)
+
+# Internal method
+def _get_compile_key_or_none(int_data, request):
+    try:
+        return _get_compile_key(int_data, request)
+    except (OSError, ValueError, IndexError):
+        return None
+
+# Internal method
+# A compilation is in flight from the moment its key is known (that is, while
+# it's waiting for a free job too), so that identical ones wait for it instead
+def _compile(int_data, request):
+    started = time.perf_counter()
+    key, waited = _run_in_job(int_data, lambda: _get_compile_key_or_none(int_data, request))
+    leader = None
+    with int_data['lock']:
+        if key is not None:
+            leader = int_data['in_flight'].get(key)
+            if leader is None:
+                int_data['in_flight'][key] = {'done' : threading.Event(), \
+                                                'response' : None, 'output_file' : _get_output_file(request)}
+    if leader is None:
+        # The waiting requests get this response if the command can't be run at all
+        response = {'returncode' : 1, 'stdout' : '', 'stderr' : 'compile broker: cannot run the command\n'}
+        try:
+            response, waited_for_compile = _run_in_job(int_data, lambda: _run(request, request['args']))
+            waited += waited_for_compile
+        finally:
+            if key is not None:
+                with int_data['lock']:
+                    in_flight = int_data['in_flight'].pop(key)
+                in_flight['response'] = response
+                in_flight['done'].set()
+    else:
+        # The same compilation is running for another request: its object is copied
+        leader['done'].wait()
+        response = leader['response']
+        try:
+            if response['returncode'] == 0:
+                shutil.copyfile(leader['output_file'], _get_output_file(request))
+            with int_data['lock']:
+                int_data['stats']['deduplicated'] += 1
+        except OSError:
+            # The object of the same compilation is already gone
+            response, waited_for_compile = _run_in_job(int_data, lambda: _run(request, request['args']))
+            waited += waited_for_compile
+    _record_latency(int_data, waited, time.perf_counter() - started, response)
+    return response
+
+# Internal method
+def _record_latency(int_data, waited, total, response):
+    with int_data['lock']:
+        int_data['stats']['completed'] += 1
+        if response['returncode'] != 0:
+            int_data['stats']['failed'] += 1
+        int_data['waited'].append(waited)
+        int_data['total'].append(total)
+
+# Internal method
+def _get_summary(seconds):
+    if not seconds:
+        return {}
+    ordered = sorted(seconds)
+    return {
+        'mean_ms' : round(sum(ordered) / len(ordered) * 1000, 1),
+        'p50_ms' : round(ordered[len(ordered) // 2] * 1000, 1),
+        'p95_ms' : round(ordered[min(len(ordered) - 1, len(ordered) * 95 // 100)] * 1000, 1),
+        'max_ms' : round(ordered[-1] * 1000, 1)
+    }
+
+# External method
+# Queue depth ('queued') is the number of compilations waiting for a free job
+def get_stats(int_data):
+    with int_data['lock']:
+        stats = dict(int_data['stats'])
+        stats['queued'] = len(int_data['queue'])
+        waited = list(int_data['waited'])
+        total = list(int_data['total'])
+    stats['jobs'] = int_data['jobs']
+    stats['queue_wait'] = _get_summary(waited)
+    stats['latency'] = _get_summary(total)
+    return stats
+
+# ========== (DATA) CONSTRUCTOR ==========
+
+def _internal_data(socket_path, jobs):
+    mydata = {
+        'socket_path' : socket_path,
+        'jobs' : jobs,
+        # The limit for all the connected SCons processes together (see function _acquire_job)
+        'free_jobs' : jobs,
+        'queue' : collections.deque(),
+        # Compile key -> the running compilation (see function _compile)
+        'in_flight' : {},
+        'lock' : threading.Lock(),
+        'stats' : {'running' : 0, 'completed' : 0, 'failed' : 0, 'deduplicated' : 0},
+        # The latencies of the last compilations (in seconds), see function get_stats
+        'waited' : collections.deque(maxlen = 1000),
+        'total' : collections.deque(maxlen = 1000),
+        # With these flags the object depends on the directory it's compiled in
+        'cwd_dependent_flags' : ('-g', '-fprofile-', '--coverage'),
+        # With these flags the compiler writes more files next to the object, and the object
+        # refers to them by name (like the .dwo of -gsplit-dwarf), so a copy of another object
+        # is not the same; such compilations are done once per object only
+        'output_dependent_flags' : ('-gsplit-dwarf',)
+    }
+    return mydata
+
+# ========== MAIN ==========
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Local compile broker for concurrent SCons builds')
+    parser.add_argument('--socket', required = True, help = 'path of the Unix socket')
+    parser.add_argument('--jobs', type = int, default = os.cpu_count() or 1, \
+                        help = 'compile jobs at once, for all the builds (default: number of CPUs)')
+    parser.add_argument('--stats', action = 'store_true', \
+                        help = 'print the stats of the running broker and exit')
+    options = parser.parse_args()
+    if options.stats:
+        stats = broker_client_class(options.socket)['get_stats']()
+        if stats is None:
+            raise SystemExit('no broker is running on ' + options.socket)
+        print(json.dumps(stats, indent = 1))
+        return
+    compile_broker_class(options.socket, options.jobs)['serve']()
+
+if __name__ == '__main__':
+    main()
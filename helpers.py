@@ -62,17 +62,55 @@ if int_data['detected_os'] == 'gentoo':
 if int_data['detected_os'] == 'debian-based':
 if int_data['detected_os'] == 'rpm-based':
 ...
-(currently, there are no such hooks).
+or, declaratively, in the OS profile (see below).
+
+==OS profiles==
+
+Each supported OS is described by a profile, a JSON file in the directory
+'profiles' (next to this file), for example profiles/gentoo.json:
+{
+    "os": "gentoo",
+    "os_name": "Gentoo",
+    "arguments": {"destdir": "DESTDIR", "prefix": "PREFIX", ...},
+    "defaults": {"prefix": "/usr"},
+    "hooks": {},
+    "staging_tree_is_rewritten": true,
+    "packager_strips": true
+}
+where
+"arguments" maps variables (see function _define_vars_data) to the names
+    of the command-line arguments they are got from on this OS,
+"defaults" are the values of the variables when their arguments are not passed,
+"hooks" map a group of variables ("install_vars" or "compile_vars") to a list
+    of names of functions from post_process_funcs (like "reset_destdir"), which
+    are called on this OS after the common functions of that group; a name
+    that is not in post_process_funcs is an error (none of the shipped
+    profiles needs a hook),
+"staging_tree_is_rewritten" tells whether the packaging tools change the installed
+    files in place (strip them, extract debug info), see INSTALL_MODE below,
+"packager_strips" tells whether the packaging tools strip the binaries and put
+    their debug info into debug packages, see SPLIT_DEBUG below.
+
+To support one more OS, it's enough to add one more file there
+(or to call method register_profile).
+
+The profiles are indexed by argument name, so that detecting OS and
+getting variables only look at the arguments actually passed,
+whatever the number of profiles is.
 
 Currently, the detecting of OS is doing so:
 
 in function _detect_os, by finding non-empty value of scons argument
-which name is determined by variable int_data['os_detected_at']:
-    (see function _define_vars_data)
+which name is determined, for each OS, by its profile's argument for
+variable int_data['os_detected_at']:
         if we found argument 'DESTDIR' with non-empty value, then,
             OS is detected as Gentoo,
         if we found argument 'install_root' with non-empty value, then,
-            OS is detected as Debian-based Distro.
+            OS is detected as Debian-based Distro,
+        if we found argument 'BUILDROOT' with non-empty value, then,
+            OS is detected as RPM-based Distro.
+If the arguments of several OSes are found, the OS registered first wins
+(the profiles are registered in the order of their file names).
 
 ==Refusing COMMAND_LINE_TARGETS==
 
@@ -81,25 +119,27 @@ command-line arguments, like
 scons -j2 DESTDIR="/some/dir" PREFIX="/some/dir"
 it performs COMPILE action
 and
-creates a variables-cache file.
+creates a variables-cache file (a configuration snapshot).
 
 The name of this file is set in function helpers_class,
 variable int_data['variables_cache_file'].
 
+It is a JSON file with the detected OS and the values of the
+variables got in function get_vars (after post-processing), and, for each
+group of variables, a fingerprint: a hash of the values of the ARGUMENTS
+(and of the "ready values") that the group depends on.
+
 With this file, no redundant actions (that are usually called
 're-configuring') will be performed during the second and all the
-consequent runs (will be performed only constructing the class
-and reading variables cache).
-
-This file contains variables that are needed for INSTALL action
-only, not for COMPILE action.
+consequent runs with the same arguments: _detect_os, get_vars and
+post-processing are skipped, the variables are taken from the file.
 
-The COMPILE action can be done after creating this file as well;
-this file does not make any harm for it.
-
-Moreover, this file makes the consequent compiling runs faster,
-because the script will not try to get variables needed for
-INSTALL action and to save them in the variables-cache file.
+If some arguments have changed, only the groups of variables that
+depend on them are got again. For example, changing CXXFLAGS does not
+make the variables for INSTALL stale, while changing DESTDIR does
+(and such a run is treated as the first one for them). The compile variables
+depend only on which OS is detected, not on the value of DESTDIR, so a new
+staging directory doesn't make them stale.
 
 THE MOST IMPORTANT PART: this script does not contain an usual
 target "install", because I prefer to use command-line arguments
@@ -127,7 +167,8 @@ scons -j2 DESTDIR="/some/dir" PREFIX="/some/dir" INSTALL=1
 
 And, in conclusion:
 As the INSTALL action requires the variables-cache file,
-it will not be performed without this file.
+it will not be performed without this file (or with a file
+saved with other DESTDIR/PREFIX).
 
 That is, if you run
 scons -j2 DESTDIR="/some/dir" PREFIX="/some/dir" INSTALL=1
@@ -141,14 +182,371 @@ A side effect of this algorithm:
 you can run this script two times with "INSTALL=1"
 (the first run will COMPILE, the second run will INSTALL)
 :)
+
+==Install manifest==
+
+Besides the binary, other files (data, docs, man pages, ...) are installed
+with INSTALL=1 when the optional key 'install_manifest' names a JSON file:
+{
+    "package": "hello-world",
+    "files": [
+        {"role": "man", "sources": "docs/Hello_World.1"},
+        {"role": "share", "sources": "data/**/*", "base": "data"},
+        {"role": "doc", "sources": ["README.md", "docs/*"], "subdir": "text"}
+    ]
+}
+where "sources" are globs (relative to the top directory, '**' matches
+subdirectories), "role" is one of:
+    bin   -> prefix/bin
+    lib   -> prefix/lib
+    share -> prefix/share/<package>
+    doc   -> prefix/share/doc/<package>
+    man   -> prefix/share/man/man<section> (the section is the extension, like .1)
+(all under DESTDIR, install_root, BUILDROOT), "base" keeps the tree of
+the files under it (otherwise they are installed flat), and "subdir" is one
+more directory under the role's one.
+Each file is installed by its own node, so they are installed in parallel
+with 'scons -jN'.
+
+==Single pass==
+
+Two runs mean two startups of SCons and two evaluations of the
+dependency graph. Passing SINGLE_PASS=1 together with INSTALL=1
+makes one run get the variables (or take them from the variables cache),
+COMPILE and INSTALL: the installed file depends on the compiled one in the
+same dependency graph, so it's installed after it's built.
+Without SINGLE_PASS=1, everything works as described above.
+
+==Sources==
+
+paths_and_names['source_name'] can be a file name, a glob (like '*.cpp')
+or a list of them, all relative to paths_and_names['source_path'].
+
+More directories can be added by the optional key 'source_set',
+a dictionary where each key is a directory and each value is
+a file name, a glob or a list of them, for example:
+    'source_set' : {'src/lib' : '*.cpp', 'src/tools' : ['a.cpp', 'b.cpp']}
+
+Each source file becomes its own object node (next to the source file),
+so 'scons -jN' compiles them in parallel.
+
+==Variants==
+
+By default, the objects are put next to the source files and the binary
+in compile_path, so switching between, for example, debug and release
+CXXFLAGS (or between the arguments of different OSes) overwrites them and
+rebuilds everything. With VARIANTS=1 IN ARGUMENTS, they go to
+compile_path/variants/<hash of CXX, CXXFLAGS and LDFLAGS as applied>/
+instead (like build/variants/0123456789abcdef/src/main.o), so the source
+tree is not touched, several configurations coexist, and switching back to
+one of them builds nothing.
+
+The variant of the last COMPILE run is the active one: it's saved in the
+variables cache with the compile variables, and INSTALL=1 installs its
+binary. 'scons -c' cleans all the variants, 'scons -c CLEAN=variant'
+cleans the active one only.
+
+==Precompiled headers==
+
+Heavy headers (like <iostream>) can be parsed once instead of once per
+source file: the optional key 'prefix_headers' names a header or a list of
+headers (relative to the top directory), for example:
+    'prefix_headers' : 'src/precompiled.hpp'
+Each of them is precompiled into
+compile_path/pch/<hash of CXX and CXXFLAGS>/<header name>.gch (with VARIANTS=1,
+under the directory of the variant), once per combination of the compiler
+and its flags, so the source tree is not changed. Every source file is
+compiled with '-iquote <that directory> -iquote <directory of the header>
+-include <header name>' (as if '#include "<header name>"' were its first
+line): GCC finds the precompiled header first and uses it if it's valid
+for the flags, or goes on to the header itself (-Winvalid-pch tells why).
+So the names of the prefix headers must differ.
+A header is precompiled again when its contents (or what it includes)
+or the compiler flags change; precompiled headers are cleaned like
+the other built files.
+The objects depend on the headers, not on the precompiled ones (which are
+not the same from build to build), so a precompiled header that is built
+again doesn't make the objects miss BUILD_CACHE. Precompiled headers
+themselves are not put into BUILD_CACHE: each is tens of MB, and it would
+push most of the objects out of a cache of limited size.
+
+==Unity build==
+
+Passing UNITY=N IN ARGUMENTS (or UNITY=auto for N taken from 'scons -jN')
+makes full rebuilds faster: the source files are grouped into N generated
+files, compile_path/unity/<N>/unity_<number>.cpp, each of them only
+#include-s its source files, and those N files are compiled instead
+(so each header is parsed once per group, not once per source file).
+
+A source file always falls into the same group (by a hash of its path),
+and a group file is rewritten only when the list of its source files
+changes, so adding or removing a file recompiles one group only.
+
+Source files that can't be combined with others (for example, because of
+conflicting names in anonymous namespaces) are compiled separately when
+they match the optional key 'unity_exclude', a glob or a list of globs
+relative to the top directory, for example:
+    'unity_exclude' : ['src/legacy/*.cpp', 'src/main.cpp']
+
+==Profile-guided optimization==
+
+Passing PGO=1 IN ARGUMENTS makes a release build in three stages, with
+the passed CXXFLAGS/LDFLAGS and on top of them:
+1) an instrumented binary is built (-fprofile-generate) in
+compile_path/pgo/<hash of CXX and CXXFLAGS>/instrumented;
+2) it is run as a training workload, with the arguments from
+PGO_TRAINING (for example, PGO_TRAINING="--repeat 1000"; none by default),
+and the profile it writes is copied next to the objects of stage 3;
+3) the usual binary (the one that is installed with INSTALL=1) is built
+with the profile and with link-time optimization (-fprofile-use -flto).
+The training run is repeated only when the instrumented binary (that is,
+the sources or the flags) or PGO_TRAINING change; otherwise the profile
+from the previous run is reused.
+In stage 3, GCC warns (-Wmissing-profile) about each function that has
+no profile: the ones the training run didn't reach, the ones it generates
+itself (like static initializers) and the ones inlined in the instrumented
+binary. A warning for every function of a source file means that its
+profile is not used at all.
+
+==Link profile==
+
+Passing LINK_PROFILE=minimal IN ARGUMENTS adds the helper's own flags
+after LDFLAGS (that is, to LINKFLAGS via linker_flags) for a binary that
+starts faster:
+- shared libraries that are not used (like libgcc_s.so.1) are not linked
+(-Wl,--as-needed);
+- the dynamic loader looks symbols up in GNU hash tables only, and the
+relocations are sorted and combined (-Wl,--hash-style=gnu, -Wl,-z,combreloc,
+-Wl,-O1, -Wl,--sort-common).
+LINK_PROFILE=minimal-static does the same and links libstdc++ and libgcc
+statically, so the loader has two libraries less to find and relocate
+(but the binary doesn't get fixes of the system libstdc++).
+The hardening flags from LDFLAGS (like -Wl,-z,now) are kept.
+
+Passing STARTUP_BENCH=N IN ARGUMENTS runs the built binary N times after
+it's built (every run, with its output to /dev/null) and prints its startup
+latency (mean, p50, p95), together with the results measured before with
+other link profiles, which are kept in startup.json next to the binary.
+So before and after are compared by two runs:
+scons ... STARTUP_BENCH=1000
+scons ... STARTUP_BENCH=1000 LINK_PROFILE=minimal
+
+==Linker==
+
+By default, the binary is linked by the default linker of the compiler.
+Passing LINKER=auto IN ARGUMENTS makes the helper probe (see probes.py)
+the faster linkers, mold, lld and gold (and bfd), all at once: each of them
+links a small program with the passed CXX, CXXFLAGS and LDFLAGS (and the
+flags of LINK_PROFILE), so a linker that doesn't accept, for example,
+-Wl,-z,relro or -Wl,--as-needed, or that is not installed, is not chosen.
+The fastest one of those that work is added to LDFLAGS (-fuse-ld=...);
+if none of them works, the default linker is used.
+LINKER=mold (lld, gold, bfd) uses that linker, if it works (and stops
+otherwise), LINKER=default doesn't probe anything.
+
+The chosen linker is saved in the variables cache with the other compile
+variables, so the linkers are probed again only when these arguments change.
+With LINKER passed, the wall time of each link is printed.
+
+==Toolchain probe==
+
+Before the compile variables are applied, the compiler is probed (see
+probes.py): its version, the value of __cplusplus with CXXFLAGS (that is,
+the language standard in effect; the sources need C++11), the -std= levels
+it supports, and whether it accepts CXXFLAGS and LDFLAGS (with the flags of
+LINK_PROFILE and LINKER). If it rejects some flags, they are probed one by
+one, and the build stops with the list of the rejected ones, before anything
+is compiled. The probes run all at once.
+
+The results are kept in int_data['toolchain_cache_file'] (next to the
+variables cache), by the path, size and mtime of the compiler binary and
+by the flags, so the next runs only look them up; an upgraded compiler is
+probed again (and the results for its older binary are dropped). Only the
+results for the last 16 compilers and flags are kept. TOOLCHAIN_PROBE=0 IN ARGUMENTS skips the probe.
+
+==Throughput benchmark==
+
+The binary can write its greeting many times (--repeat N, or --bytes N with
+an optional suffix K, M or G), filling its output buffers in several threads
+(--threads N). Passing THROUGHPUT_BENCH IN ARGUMENTS with the arguments
+for the binary, for example
+scons THROUGHPUT_BENCH="--bytes 1G --threads 4"
+runs it after it's built (every run, even if nothing is rebuilt), reads
+all its output through a pipe and prints the throughput in MB/s
+(10^6 bytes per second); the result is also written to throughput.json
+next to the binary.
+
+Libraries the binary is linked with (like pthread, for --threads on older
+C libraries) are listed in the optional key 'link_libraries', a name or
+a list of names, for example:
+    'link_libraries' : 'pthread'
+
+==Compile broker==
+
+When several builds run on the same host at the same time (for example,
+Debian, RPM and Gentoo packages), passing COMPILE_BROKER=/path/to/socket
+IN ARGUMENTS to each of them makes all their compile commands go through
+one compile broker (see compile_broker.py), that limits the number of
+compilers running at once for all the builds together and compiles
+identical sources with identical flags once. When the broker is not
+running, the sources are compiled directly.
+
+==Build cache==
+
+Passing BUILD_CACHE=/some/dir IN ARGUMENTS makes the compiled files
+shared between runs (and between builds of different packages on the same
+host) via SCons CacheDir. A file is taken from the cache only when the
+compiler, all the flags and the sources are the same.
+
+The size of the cache is limited by BUILD_CACHE_SIZE (bytes, or with
+one of suffixes K, M, G; 1G by default): at the end of each run the least
+recently used files are removed, and a summary of hits/misses/bytes
+is printed.
+
+==Incremental mode==
+
+Passing INCREMENTAL=1 IN ARGUMENTS makes no-op and small rebuilds of
+big trees faster:
+- the results of scanning sources for #include are kept between runs
+(SCons implicit cache) instead of rescanning every source every run;
+- a file is hashed again only if its timestamp has changed
+(SCons 'content-timestamp' decider).
+When the compile variables (CXX, CXXFLAGS, ...) differ from the ones in
+the variables cache, all the sources are rescanned.
+
+==Automatic job count==
+
+This script doesn't make anybody pass -jN. With AUTO_JOBS=1 IN ARGUMENTS
+the number of jobs is:
+- not more than the CPUs this process may run on (and the CPU quota of its
+cgroup, cpu.max or cpu.cfs_quota_us of cgroup v1, in containers);
+- not more than the available memory (MemAvailable and the memory limit
+of its cgroup, memory.max or memory.limit_in_bytes of cgroup v1, whichever
+is less; 80% of it) divided by the peak memory of the most memory-hungry
+compilation.
+The peak memory of each compilation is measured (by the resources its
+process used) and saved to int_data['compile_memory_file'] (next to the
+variables cache) for the next runs; until then, 512 MiB per compilation
+is assumed. The objects that are no longer in the build manifest
+(like the ones of removed sources) are dropped from it.
+
+A -jN passed on the command line (or in SCONSFLAGS) always wins.
+
+==Matrix build==
+
+Passing MATRIX=/some/file.json IN ARGUMENTS builds several configurations
+in one run (and in one dependency graph, so 'scons -jN' schedules all of them
+in parallel). The file is a list of configurations, each with its own
+arguments (the ones from the OS profiles), for example:
+[
+    {"name" : "release", "arguments" : {"DESTDIR" : "/tmp/release", "PREFIX" : "/usr",
+                    "CXX" : "g++", "CXXFLAGS" : "-O2", "LDFLAGS" : "-Wl,-O1"}},
+    {"name" : "debug", "arguments" : {"install_root" : "/tmp/debug", "prefix" : "/usr",
+                    "CXX" : "g++", "CXXFLAGS" : "-O0 -g", "LDFLAGS" : ""}}
+]
+Other arguments (like INSTALL=1 or BUILD_CACHE) are common for all of them.
+
+Each configuration gets its own Environment and its own binary in
+compile_path/matrix/<name>; the objects are put in
+compile_path/objects/<hash of CXX and CXXFLAGS>, so configurations with
+the same compile flags share them.
+
+The variables cache is not used in this mode: with "INSTALL=1" each
+configuration is compiled and installed in the same run.
+
+==Cleaning==
+
+Every compile and install run appends the files it produces (objects,
+binaries, installed files) to the build manifest, file
+int_data['build_manifest_file']. Cleaning (scons -c) reads it once and
+deletes the listed files (in parallel when there are many of them), together
+with the SCons database, the variables cache and the manifest itself.
+So it needs neither the arguments nor the Environment.
+
+Files outside the current directory (like DESTDIR=/var/tmp/...) are never
+deleted.
+
+Package builds run 'scons -c' before every build (debian/rules in
+override_dh_auto_clean, %clean in the RPM spec), which makes every build
+a cold one. Passing CLEAN=outputs IN ARGUMENTS together with -c removes
+only the outputs: the SCons database and the variables cache are kept, and the
+files of the build manifest are moved aside, into
+int_data['clean_stash_dir'] under the build directory. The next run
+(COMPILE or INSTALL, whatever it builds) moves all of them back before SCons
+looks at them and removes the stash, so only what has actually changed
+is built again. CLEAN=all (the default) removes everything, including
+what was moved aside.
+
+==Split debug info==
+
+The distro flags always contain -g, and all that debug info goes through
+the linker and is copied into the install tree, only to be extracted from
+it again. Passing SPLIT_DEBUG=1 IN ARGUMENTS
+(to both COMPILE and INSTALL runs) changes it:
+- the sources are compiled with -gsplit-dwarf: the debug info of each object
+goes to a .dwo file next to it, and the linker only gets small skeletons;
+- with INSTALL=1, the binary is installed stripped (and with a
+.gnu_debuglink), its debug info is written to
+<prefix>/lib/debug/<prefix>/<install_path>/<binary>.debug and the .dwo files
+are packed next to it (<binary>.dwp), with a link
+<prefix>/lib/debug/.build-id/xx/yyyy.debug (by the build ID of the binary),
+where the debuggers (and the dbgsym/debuginfo packaging) look for them.
+Each binary is handled by its own node, so 'scons -jN' extracts the debug
+info of several binaries in parallel.
+As dwp of binutils doesn't read DWARF 5 split units, -gdwarf-4 is added too.
+
+That is for an OS profile with "packager_strips": false. Where the packaging
+tools strip the binaries and extract their debug info themselves ("packager_strips":
+true, all the supported OSes), the sources are still compiled with -gsplit-dwarf
+(and linked with the small skeletons), but the binary is installed unstripped,
+as usual, and only the .dwo files are packed, into
+<prefix>/lib/debug/<prefix>/<install_path>/<binary>.dwp, for the tools to
+find it next to the debug info they extract:
+- RPM-based: find-debuginfo extracts the skeletons, and the -debuginfo package
+gets all of /usr/lib/debug, the .dwp too (it needs no line in %files);
+- Gentoo: estrip extracts the skeletons (with FEATURES=splitdebug), and the
+.dwp is installed with the package, like the other files of /usr/lib/debug;
+- Debian-based: dh_strip extracts the skeletons into the dbgsym package, but
+it doesn't know about the .dwp, which stays in the main package unless
+debian/rules moves it (for example, with dh_install into the -dbgsym directory).
+
+==Install mode==
+
+By default, INSTALL action copies the binary into DESTDIR.
+Passing INSTALL_MODE=link IN ARGUMENTS makes it, when the build tree and
+DESTDIR are on the same filesystem, try a reflink (copy-on-write clone:
+no data copied, but still a separate file), then a hard link, then
+a usual copy. Permissions and timestamps are preserved.
+
+A hard link is used only if the OS profile says that the staging tree
+is not rewritten in place: otherwise dh_strip, estrip or the RPM debuginfo
+extraction would modify the build tree through the shared file.
+
+==Tracing==
+
+Passing TRACE=/some/file.json IN ARGUMENTS writes, at the end of the run,
+a Chrome trace (see tracing.py) with the durations of the phases (constructing
+the class, reading/saving the variables cache, detecting OS, getting/applying
+variables, cleaning) and of every compiled, linked, installed node and
+build cache retrieval (one row per SCons job).
 """
 
+import atexit
 from collections import OrderedDict
+import concurrent.futures
+import fnmatch
+import glob
+import hashlib
+import json
 import os
 import os.path
 import re
+import shlex
+import shutil
 import sys
 
+from probes import probes_class
+from tracing import tracing_class
 from wrappers import wrappers_class
 
 def exit_err_1(message):
@@ -158,13 +556,19 @@ def exit_err_1(message):
 # os.path.join drops all other parts when one part is an absolute path;
 # os.path.normpath takes only one argument...
 # In short, I haven't yet found the proper built-in function :)
-def myown_os_path_join(*paths):
+# The characters allowed in paths (the separator included, so the joined path
+# is checked at once instead of each of its parts)
+# (with fullmatch: '$' would accept a new line at the end)
+_path_pattern = re.compile("[a-zA-Z0-9_." + os.path.sep + "-]+")
+# The same for many paths separated by NUL, which no path can contain
+# (see function myown_os_path_join_batch)
+_paths_pattern = re.compile("[a-zA-Z0-9_." + os.path.sep + "\0-]+")
+
+def _join_paths(paths):
     joined = ''
     for path in paths:
-        pattern = re.compile("^[a-zA-Z0-9_." + os.path.sep + "-]+$")
-        match = pattern.match(path)
-        if not match:
-            exit_err_1('myown_os_path_join ERROR: path contains forbidden character(s)')
+        if not path:
+            exit_err_1('myown_os_path_join ERROR: path is empty')
         if joined.endswith('/') and path.startswith('/'):
             fixed = path[1:]
             path = fixed
@@ -173,24 +577,65 @@ def myown_os_path_join(*paths):
         joined += path
     return joined
 
+def myown_os_path_join(*paths):
+    joined = _join_paths(paths)
+    if not _path_pattern.fullmatch(joined):
+        exit_err_1('myown_os_path_join ERROR: path contains forbidden character(s)')
+    return joined
+
+# Joins each tuple of paths_list, like myown_os_path_join, but checks all the results at once
+def myown_os_path_join_batch(paths_list):
+    joined_list = [_join_paths(paths) for paths in paths_list]
+    joined_paths = '\0'.join(joined_list)
+    if joined_list and (not _paths_pattern.fullmatch(joined_paths) or \
+                        joined_paths.count('\0') != len(joined_list) - 1):
+        for joined in joined_list:
+            if not _path_pattern.fullmatch(joined):
+                exit_err_1('myown_os_path_join_batch ERROR: path ' + repr(joined) + \
+                                                ' contains forbidden character(s)')
+    return joined_list
+
 # If you are surprised that I call it a class:
 # https://forums.gentoo.org/viewtopic-p-8527031.html#8527031
 # (search string: "OOP, because perl") :)
 def helpers_class(paths_and_names):
-    int_data, post_process_funcs, targets_to_clean = _internal_data(paths_and_names)
+    tracer = tracing_class()
+    started = tracer['now']()
+    int_data, post_process_funcs, targets_to_clean = _internal_data(paths_and_names, tracer)
+    tracer['add_event']('helpers_class', 'phase', started)
+    _write_trace_at_exit(int_data)
+    return _ext_methods(int_data, post_process_funcs, targets_to_clean)
+
+def _ext_methods(int_data, post_process_funcs, targets_to_clean):
+    # Phases recorded by the tracer (see TRACE=... above)
+    traced = lambda name, func: int_data['tracer']['trace'](name, 'phase', func)
 
     ext_methods = {
-        'get_vars' : lambda *args: get_vars(int_data, post_process_funcs, args[0]),
-        'apply_vars' : lambda *args: apply_vars(int_data, args[0]),
-        'get_myown_env_variable' : lambda *args: get_myown_env_variable(int_data, args[0]),
-        'read_variables_cache' : lambda: read_variables_cache(int_data),
-        'save_variables_cache' : lambda: save_variables_cache(int_data),
+        'get_vars' : lambda *args: traced('get_vars ' + args[0], \
+                                    lambda: get_vars(int_data, post_process_funcs, args[0])),
+        'apply_vars' : lambda *args: traced('apply_vars ' + args[0], \
+                                    lambda: apply_vars(int_data, args[0])),
+        'are_vars_cached' : lambda *args: are_vars_cached(int_data, args[0]),
+        'register_profile' : lambda *args: register_profile(int_data, post_process_funcs, args[0]),
+        'read_variables_cache' : lambda: traced('read_variables_cache', \
+                                    lambda: read_variables_cache(int_data)),
+        'save_variables_cache' : lambda: traced('save_variables_cache', \
+                                    lambda: save_variables_cache(int_data)),
         'program_compile' : lambda: program_compile(int_data),
         'program_install' : lambda: program_install(int_data),
+        'program_throughput_benchmark' : lambda: program_throughput_benchmark(int_data),
+        'program_startup_benchmark' : lambda: program_startup_benchmark(int_data),
+        'use_build_cache' : lambda: use_build_cache(int_data),
+        'use_incremental_mode' : lambda: use_incremental_mode(int_data),
+        'use_auto_jobs' : lambda: traced('use_auto_jobs', lambda: use_auto_jobs(int_data)),
+        'probe_toolchain' : lambda: traced('probe_toolchain', lambda: probe_toolchain(int_data)),
         'is_this_option_passed' : lambda *args: is_this_option_passed(int_data, args[0]),
         'is_install_argument_passed_and_1' : lambda: is_install_argument_passed_and_1(int_data),
+        'is_single_pass_argument_passed_and_1' : lambda: is_single_pass_argument_passed_and_1(int_data),
         'is_any_target_passed' : lambda: is_any_target_passed(int_data),
-        'clean_targets' : lambda : clean_targets(targets_to_clean)
+        'get_matrix_helpers' : lambda: get_matrix_helpers(int_data),
+        'clean_targets' : lambda : traced('clean_targets', \
+                                    lambda: clean_targets(int_data, targets_to_clean))
     }
     return ext_methods
 
@@ -198,50 +643,88 @@ def helpers_class(paths_and_names):
 
 # ========== METHODS ==========
 
+# Internal method
+# Returns the pairs (OS, variable) that the passed arguments are got for,
+# looking only at the arguments with non-empty values
+def _get_passed_arguments_index(int_data):
+    passed_index = []
+    for argname, argvalue in int_data['scons_wrappers']['get_arguments_from_cli']().items():
+        if argvalue and argname in int_data['arguments_index']:
+            for os_key, var_key in int_data['arguments_index'][argname]:
+                passed_index.append((argname, argvalue, os_key, var_key))
+    return passed_index
+
+# Internal method
+# The OS that the passed arguments detect (by their names, not by their values), or ''
+def _get_os_detected_by_arguments(int_data):
+    detected_oses = []
+    for argname, argvalue, os_key, var_key in _get_passed_arguments_index(int_data):
+        if var_key == int_data['os_detected_at']:
+            detected_oses.append(os_key)
+    if not detected_oses:
+        return ''
+    # The OS that was registered first
+    return min(detected_oses, key = list(int_data['supported_oses']).index)
+
 # Internal method
 def _detect_os(int_data):
     if int_data['detected_os']:
         exit_err_1('re-detecting Operating System is not supported')
-    for key, nested_dict in int_data['supported_oses'].items():
-        os_argname = nested_dict[int_data['os_detected_at']]
-        print('checking for ' + int_data['os_detected_at'] + ' as ' + os_argname + \
-                                        '... (are we on ' + nested_dict['os_name'] + '?)')
-        os_argvalue = int_data['scons_wrappers']['get_argument_from_cli'](os_argname)
-        if os_argvalue:
-            int_data['detected_os'] = key
-            print('detected Operating System: ' + int_data['detected_os'])
-            return 1
+    detected_os = _get_os_detected_by_arguments(int_data)
+    if detected_os:
+        int_data['detected_os'] = detected_os
+        print('detected Operating System: ' + int_data['detected_os'] + ' (by argument ' + \
+                    _get_os_argname(int_data, int_data['detected_os'], int_data['os_detected_at']) + ')')
+        return 1
     print('Operating System not detected')
     print('If your Operating System is not supported, you can simulate one of ' + \
                     'supported OSes by passing parameters with names that it has')
     exit_err_1('Parameter names that each of supported Operating Systems has, ' + \
-                    'you can see them in function _define_vars_data')
+                    'you can see them in the OS profiles: ' + int_data['profiles_dir'])
+
+# Internal method
+def _get_os_argname(int_data, os_key, var_key):
+    return int_data['supported_oses'][os_key]['arguments'].get(var_key, '')
 
 # Internal method
 def _get_from_os(int_data, argname):
+    if int_data['detected_os'] == '':
+        _restore_detected_os(int_data)
     if int_data['detected_os'] == '' and argname != int_data['os_detected_at']:
         exit_err_1('_get_from_os ERROR: when getting ' + argname + \
                                 ' value, OS should be already detected')
-    if argname == int_data['os_detected_at']:
-        _detect_os(int_data)
+    if int_data['detected_os'] == '':
+        int_data['tracer']['trace']('_detect_os', 'phase', lambda: _detect_os(int_data))
     detected_os = int_data['detected_os']
-    this_os_argname = int_data['supported_oses'][detected_os][argname]
-    argvalue = int_data['scons_wrappers']['get_argument_from_cli'](this_os_argname)
+    os_profile = int_data['supported_oses'][detected_os]
+    this_os_argname = _get_os_argname(int_data, detected_os, argname)
+    if not this_os_argname:
+        print(argname + ' is not got from arguments in ' + os_profile['os_name'])
+        argvalue = ''
+    else:
+        argvalue = int_data['scons_wrappers']['get_argument_from_cli'](this_os_argname)
     if argvalue:
         print(argname + ' (' + this_os_argname + ' in ' + \
-                int_data['supported_oses'][detected_os]['os_name'] + \
-                ') argument found: ' + argvalue)
+                os_profile['os_name'] + ') argument found: ' + argvalue)
         return argvalue
+    if argname in os_profile['defaults']:
+        print(argname + ' (' + this_os_argname + ' in ' + os_profile['os_name'] + \
+                ') argument not found, default value is used: ' + os_profile['defaults'][argname])
+        return os_profile['defaults'][argname]
     print(argname + ' (' + this_os_argname + ' in ' + \
-                int_data['supported_oses'][detected_os]['os_name'] + \
-                ') argument not found')
+                os_profile['os_name'] + ') argument not found')
     return ''
 
 # Internal method, goes to post_process_funcs
 def _reset_destdir(int_data):
     print('initially, destdir is set for default value without prefix: ' + \
                                                         int_data['got_vars']['destdir'])
+    # The root for the files of the install manifest (see function _install_from_manifest)
+    int_data['got_vars']['install_root'] = int_data['got_vars']['destdir']
     if 'prefix' in int_data['got_vars'] and int_data['got_vars']['prefix']:
+        int_data['got_vars']['install_root'] = myown_os_path_join( \
+                                int_data['got_vars']['destdir'], \
+                                int_data['got_vars']['prefix'])
         int_data['got_vars']['destdir'] = myown_os_path_join(\
                                 int_data['got_vars']['destdir'], \
                                 int_data['got_vars']['prefix'], \
@@ -249,18 +732,137 @@ def _reset_destdir(int_data):
         print('destdir is reset using prefix and install_path: ' + \
                                 int_data['got_vars']['destdir'])
 
+# Internal method, goes to post_process_funcs
+# The flags of the link profile are added after the ones from the arguments
+def _apply_link_profile(int_data):
+    link_profile = int_data['got_vars']['link_profile']
+    if not link_profile:
+        return
+    link_flags = ' '.join(int_data['link_profiles'][link_profile])
+    if int_data['got_vars'].get('linker_flags'):
+        link_flags = int_data['got_vars']['linker_flags'] + ' ' + link_flags
+    int_data['got_vars']['linker_flags'] = link_flags
+    print('linker_flags are extended by link profile ' + link_profile + ': ' + link_flags)
+
+# Internal method, goes to post_process_funcs
+# The linkers are probed with the compiler and the flags that are going to be used;
+# the chosen one is saved in the variables cache, so they are probed again only
+# when CXX, CXXFLAGS, LDFLAGS, LINK_PROFILE or LINKER change
+def _select_linker(int_data):
+    requested = int_data['got_vars']['linker']
+    if not requested or requested == 'default':
+        return
+    linkers = int_data['linkers'] if requested == 'auto' else [requested]
+    results = int_data['probes']['probe_linkers']( \
+                            int_data['got_vars'].get('cpp_compiler') or int_data['default_cpp_compiler'], \
+                            shlex.split(int_data['got_vars'].get('cpp_compiler_flags', '')), \
+                            shlex.split(int_data['got_vars'].get('linker_flags', '')), linkers)
+    working = []
+    for linker in linkers:
+        if results[linker] == 1:
+            print('linker ' + linker + ' works with CXX, CXXFLAGS and LDFLAGS')
+            working.append(linker)
+        else:
+            print('linker ' + linker + ' does not work: ' + results[linker])
+    if not working and requested != 'auto':
+        exit_err_1('_select_linker ERROR: LINKER=' + requested + ' does not work with CXX, CXXFLAGS and LDFLAGS')
+    if not working:
+        print('none of the linkers works, the default one of the compiler is used')
+        int_data['got_vars']['linker'] = 'default'
+        return
+    # The linkers are probed in the order from the fastest one
+    int_data['got_vars']['linker'] = working[0]
+    link_flags = '-fuse-ld=' + working[0]
+    if int_data['got_vars'].get('linker_flags'):
+        link_flags = int_data['got_vars']['linker_flags'] + ' ' + link_flags
+    int_data['got_vars']['linker_flags'] = link_flags
+    print('selected linker: ' + working[0])
+
+# Internal method, goes to post_process_funcs
+# The directory of the objects and of the binary, by a hash of the compile
+# variables applied to the Environment (with the flags of the link profile and
+# of the linker), so that each configuration has its own
+def _select_variant_dir(int_data):
+    if not int_data['got_vars']['variant_dir']:
+        return
+    applied_vars = []
+    for var_key, var_dict in int_data['vars_data']['compile_vars'].items():
+        if var_dict['is_applied_to_scons_env']:
+            applied_vars.append([var_key, int_data['got_vars'].get(var_key, '')])
+    int_data['got_vars']['variant_dir'] = myown_os_path_join(int_data['paths_and_names']['compile_path'], \
+                                            int_data['variants_dir'], _get_fingerprint(applied_vars)[:16])
+    print('variant directory: ' + int_data['got_vars']['variant_dir'])
+
 # Internal method, uses post_process_funcs
 def _launch_post_process(int_data, post_process_funcs, vars_name):
+    funcnames = []
     for var_dict in int_data['vars_data'][vars_name].values():
-        funcname = var_dict['is_post_processed_in_a_function']
-        if funcname:
-            if funcname in post_process_funcs:
-                post_process_funcs[funcname]()
-            else:
-                exit_err_1('_launch_post_process ERROR: function ' + funcname + ' is not defined')
+        if var_dict['is_post_processed_in_a_function']:
+            funcnames.append(var_dict['is_post_processed_in_a_function'])
+    # The hooks of the detected OS are called after the common functions
+    if int_data['detected_os']:
+        funcnames += int_data['supported_oses'][int_data['detected_os']]['hooks'].get(vars_name, [])
+    for funcname in funcnames:
+        if funcname in post_process_funcs:
+            post_process_funcs[funcname]()
+        else:
+            exit_err_1('_launch_post_process ERROR: function ' + funcname + ' is not defined')
 
-# External method (FACADE: _get_from_os | use int_data['my_vars'])
+# Internal method
+def _get_fingerprint(argnames_and_values):
+    serialized = json.dumps(sorted(argnames_and_values))
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+# Internal method
+# The hash of all the passed arguments OS can be detected at
+# (and of the OS profiles, as they define which arguments these are)
+def _get_os_fingerprint(int_data):
+    argnames_and_values = [['profiles', int_data['profiles_fingerprint']]]
+    for argname, argvalue, os_key, var_key in _get_passed_arguments_index(int_data):
+        if var_key == int_data['os_detected_at']:
+            argnames_and_values.append([argname, argvalue])
+    return _get_fingerprint(argnames_and_values)
+
+# Internal method
+# The hash of all the passed arguments (for all supported OSes) and "ready values"
+# that the variables of vars_name depend on, and of the OS they are got for;
+# the value of the argument OS is detected at (like DESTDIR) is hashed only
+# by the variables that use it, so a new staging directory doesn't change compile_vars
+def _get_vars_fingerprint(int_data, vars_name):
+    vars_dict = int_data['vars_data'][vars_name]
+    detected_os = int_data['detected_os'] or _get_os_detected_by_arguments(int_data)
+    argnames_and_values = [['detected_os', detected_os], ['profiles', int_data['profiles_fingerprint']]]
+    for argname, argvalue, os_key, var_key in _get_passed_arguments_index(int_data):
+        if var_key in vars_dict and [argname, argvalue] not in argnames_and_values:
+            argnames_and_values.append([argname, argvalue])
+    for var_key, var_dict in vars_dict.items():
+        if not var_dict['is_got_from_arguments']:
+            argnames_and_values.append([var_key, int_data['my_vars'][var_key]])
+    return _get_fingerprint(argnames_and_values)
+
+# Internal method
+def _restore_detected_os(int_data):
+    snapshot_os = int_data['snapshot'].get('detected_os')
+    if snapshot_os and snapshot_os['fingerprint'] == _get_os_fingerprint(int_data):
+        int_data['detected_os'] = snapshot_os['value']
+        print('detected Operating System (taken from the snapshot): ' + int_data['detected_os'])
+
+# Internal method
+def _get_fresh_snapshot_vars(int_data, vars_name):
+    snapshot_vars = int_data['snapshot'].get('vars', {}).get(vars_name)
+    if snapshot_vars and snapshot_vars['fingerprint'] == _get_vars_fingerprint(int_data, vars_name):
+        return snapshot_vars['got_vars']
+    return None
+
+# External method (FACADE: the snapshot | _get_from_os | use int_data['my_vars'])
 def get_vars(int_data, post_process_funcs, vars_name):
+    snapshot_got_vars = _get_fresh_snapshot_vars(int_data, vars_name)
+    if snapshot_got_vars is not None:
+        print('get_vars: ' + vars_name + ' are taken from the snapshot (the arguments are not changed)')
+        int_data['got_vars'].update(snapshot_got_vars)
+        int_data['got_vars_names'][vars_name] = 1
+        int_data['got_vars_from_snapshot'][vars_name] = 1
+        return
     for var_key, var_dict in int_data['vars_data'][vars_name].items():
         print('get_vars: ' + var_key)
         if var_dict['is_got_from_arguments']:
@@ -270,49 +872,604 @@ def get_vars(int_data, post_process_funcs, vars_name):
         else:
             int_data['got_vars'][var_key] = int_data['my_vars'][var_key]
     _launch_post_process(int_data, post_process_funcs, vars_name)
+    int_data['got_vars_names'][vars_name] = 1
 
 # External method
 def apply_vars(int_data, vars_name):
     for var_key, var_dict in int_data['vars_data'][vars_name].items():
         is_applied_to_scons_env = var_dict['is_applied_to_scons_env']
-        if is_applied_to_scons_env:
+        if is_applied_to_scons_env and var_key not in int_data['got_vars']:
+            # An empty argument (like LDFLAGS="") is not an error
+            print('not setting ' + is_applied_to_scons_env + ' (' + var_key + ' is not got)')
+        elif is_applied_to_scons_env:
             myvalue = int_data['got_vars'][var_key]
             print('setting ' + is_applied_to_scons_env + ' to ' + myvalue)
             int_data['scons_wrappers']['replace_var_in_env'](is_applied_to_scons_env, myvalue)
 
 # External method
-def get_myown_env_variable(int_data, usedname):
-    varname = int_data['myown_env_variables'][usedname][0]
-    value = int_data['scons_wrappers']['get_var_from_env'](varname)
-    return value
-
-# Internal method
-def _set_myown_env_variable(int_data, usedname, value):
-    varname = int_data['myown_env_variables'][usedname][0]
-    int_data['scons_wrappers']['append_value_to_var_in_env'](varname, value)
+# Whether all the variables of vars_name that are needed in the next runs
+# are in the snapshot and were got from the same arguments
+def are_vars_cached(int_data, vars_name):
+    snapshot_got_vars = _get_fresh_snapshot_vars(int_data, vars_name)
+    if snapshot_got_vars is None:
+        return 0
+    for var_key, var_dict in int_data['vars_data'][vars_name].items():
+        if var_dict['is_required_in_cache'] and not snapshot_got_vars.get(var_key):
+            return 0
+    return 1
 
 # External method
 def read_variables_cache(int_data):
-    descriptions = int_data['myown_env_variables']
-    int_data['scons_wrappers']['read_vars_from_cache'](descriptions)
+    if int_data['variables_cache_read']:
+        return
+    int_data['variables_cache_read'] = 1
+    variables_cache_file = int_data['variables_cache_file']
+    if not os.path.isfile(variables_cache_file):
+        print('variables cache ' + variables_cache_file + ' not found')
+        return
+    try:
+        with open(variables_cache_file) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except ValueError:
+        print('read_variables_cache WARNING: ' + variables_cache_file + ' is broken; ignored')
+        return
+    if snapshot.get('format') != int_data['snapshot_format']:
+        print('read_variables_cache WARNING: ' + variables_cache_file + ' has another format; ignored')
+        return
+    print('variables cache ' + variables_cache_file + ' read')
+    int_data['snapshot'] = snapshot
 
 # External method
 def save_variables_cache(int_data):
-    descriptions = int_data['myown_env_variables']
-    got_vars = int_data['got_vars']
-    int_data['scons_wrappers']['save_vars_to_cache'](descriptions, got_vars)
+    snapshot = {
+        'format' : int_data['snapshot_format'],
+        'vars' : dict(int_data['snapshot'].get('vars', {}))
+    }
+    if int_data['detected_os']:
+        snapshot['detected_os'] = {
+            'fingerprint' : _get_os_fingerprint(int_data),
+            'value' : int_data['detected_os']
+        }
+    elif 'detected_os' in int_data['snapshot']:
+        snapshot['detected_os'] = int_data['snapshot']['detected_os']
+    for vars_name in int_data['got_vars_names']:
+        got_vars = {}
+        for var_key, var_dict in int_data['vars_data'][vars_name].items():
+            if var_key in int_data['got_vars']:
+                got_vars[var_key] = int_data['got_vars'][var_key]
+        snapshot['vars'][vars_name] = {
+            'fingerprint' : _get_vars_fingerprint(int_data, vars_name),
+            'got_vars' : got_vars
+        }
+    if snapshot == int_data['snapshot']:
+        print('variables cache is up to date')
+        return
+    variables_cache_file = int_data['variables_cache_file']
+    print('saving variables cache ' + variables_cache_file + '...')
+    # Written to a temporary file first, so that the snapshot is never half-written
+    with open(variables_cache_file + '.tmp', 'w') as snapshot_file:
+        json.dump(snapshot, snapshot_file, indent=1, sort_keys=True)
+    os.replace(variables_cache_file + '.tmp', variables_cache_file)
+    int_data['snapshot'] = snapshot
 
 # External method
 def program_compile(int_data):
-    compile_source = int_data['got_vars']['source_full']
-    compile_target = int_data['got_vars']['compile_target']
-    int_data['scons_wrappers']['will_compile'](compile_source, compile_target)
+    compile_sources = int_data['got_vars']['sources_full']
+    unity_batches = _get_unity_batches(int_data)
+    if unity_batches:
+        compile_sources = _get_unity_sources(int_data, compile_sources, unity_batches)
+    if _is_this_argument_passed(int_data, 'PGO') == '1':
+        _program_compile_with_profile(int_data, compile_sources)
+        return
+    compile_objects = _get_object_files(int_data, compile_sources)
+    compile_target = _get_compile_target(int_data)
+    compile_units = list(zip(compile_objects, compile_sources))
+    extra_flags = _merge_extra_flags(_get_split_debug_flags(int_data), _get_link_libraries(int_data))
+    precompiled_headers = _get_precompiled_headers(int_data, extra_flags.get('CXXFLAGS', []))
+    produced_files = int_data['scons_wrappers']['will_compile'](compile_units, compile_target, \
+                                                precompiled_headers, extra_flags, [])
+    produced_files += _get_split_dwarf_files(int_data, compile_objects)
+    _record_in_build_manifest(int_data, produced_files)
+
+# Internal method
+# The binary of the active variant (see function _select_variant_dir), if any
+def _get_compile_target(int_data):
+    if int_data['got_vars'].get('variant_dir'):
+        return myown_os_path_join(int_data['got_vars']['variant_dir'], \
+                                    int_data['paths_and_names']['binary_name'])
+    return int_data['my_vars']['compile_target']
+
+# Internal method
+# In an INSTALL run the compile variables are not got: the active variant
+# is the one of the last COMPILE run, as saved in the variables cache
+def _get_install_source(int_data):
+    variant_dir = int_data['got_vars'].get('variant_dir')
+    if variant_dir is None:
+        variant_dir = int_data['snapshot'].get('vars', {}).get('compile_vars', {}).get('got_vars', {}).get('variant_dir')
+    if variant_dir:
+        print('installing from variant ' + variant_dir)
+        if 'variant_dir' not in int_data['got_vars'] and _get_fresh_snapshot_vars(int_data, 'compile_vars') is None:
+            print('_get_install_source WARNING: the compile arguments are not the same as in the last ' + \
+                            'COMPILE run; its variant is installed')
+        return myown_os_path_join(variant_dir, os.path.basename(int_data['got_vars']['compile_target']))
+    return int_data['got_vars']['compile_target']
+
+# Internal method
+# Three stages: the instrumented build, the training run, the build with the profile
+def _program_compile_with_profile(int_data, compile_sources):
+    profile_dir = _get_profile_dir(int_data)
+    instrumented_units = []
+    optimized_units = []
+    profiles = []
+    for source_full in compile_sources:
+        object_file = os.path.splitext(source_full)[0] + '.o'
+        instrumented_object = myown_os_path_join(profile_dir, 'instrumented', object_file)
+        optimized_object = myown_os_path_join(profile_dir, 'optimized', object_file)
+        instrumented_units.append((instrumented_object, source_full))
+        optimized_units.append((optimized_object, source_full))
+        # GCC writes (and reads) the profile of an object next to the object
+        profiles.append((os.path.splitext(instrumented_object)[0] + '.gcda', \
+                            os.path.splitext(optimized_object)[0] + '.gcda'))
+    instrumented_target = myown_os_path_join(profile_dir, 'instrumented', \
+                                                int_data['paths_and_names']['binary_name'])
+    training_arguments = shlex.split(_is_this_argument_passed(int_data, 'PGO_TRAINING') or '')
+
+    generate_flags = int_data['profile_generate_flags']
+    generate_extra_flags = _merge_extra_flags({'CXXFLAGS' : generate_flags, 'LINKFLAGS' : generate_flags}, \
+                            _get_split_debug_flags(int_data), _get_link_libraries(int_data))
+    produced_files = int_data['scons_wrappers']['will_compile'](instrumented_units, instrumented_target, \
+                            _get_precompiled_headers(int_data, generate_extra_flags['CXXFLAGS']), \
+                            generate_extra_flags, [])
+    produced_files += int_data['scons_wrappers']['will_train'](instrumented_target, \
+                                                                training_arguments, profiles)
+    use_flags = int_data['profile_use_flags']
+    use_extra_flags = _merge_extra_flags({'CXXFLAGS' : use_flags, 'LINKFLAGS' : int_data['profile_use_link_flags']}, \
+                            _get_split_debug_flags(int_data), _get_link_libraries(int_data))
+    produced_files += int_data['scons_wrappers']['will_compile'](optimized_units, \
+                            _get_compile_target(int_data), \
+                            _get_precompiled_headers(int_data, use_extra_flags['CXXFLAGS']), use_extra_flags, \
+                            [optimized_profile for instrumented_profile, optimized_profile in profiles])
+    produced_files += _get_split_dwarf_files(int_data, [instrumented_object for instrumented_object, \
+                            source_full in instrumented_units] + [optimized_object for optimized_object, \
+                            source_full in optimized_units])
+    # The profiles written by the instrumented binary itself are not known to SCons
+    produced_files += [instrumented_profile for instrumented_profile, optimized_profile in profiles]
+    _record_in_build_manifest(int_data, produced_files)
+
+# Internal method
+# Nothing is shared between the configurations of a matrix build, as each of them
+# has its own training run
+def _get_profile_dir(int_data):
+    if int_data['matrix_name']:
+        return myown_os_path_join(int_data['paths_and_names']['compile_path'], \
+                                    'matrix', int_data['matrix_name'], 'pgo')
+    return myown_os_path_join(int_data['paths_and_names']['compile_path'], \
+                                'pgo', _get_compile_flags_hash(int_data, []))
+
+# Internal method
+# Extra flags for will_compile (like {'CXXFLAGS' : [...]}) from several sources together
+def _merge_extra_flags(*extra_flags_list):
+    merged = {}
+    for extra_flags in extra_flags_list:
+        for flags_name, flags in extra_flags.items():
+            merged[flags_name] = merged.get(flags_name, []) + flags
+    return merged
+
+# Internal method
+def _is_split_debug(int_data):
+    return _is_this_argument_passed(int_data, 'SPLIT_DEBUG') == '1'
+
+# Internal method
+def _get_split_debug_flags(int_data):
+    if not _is_split_debug(int_data):
+        return {}
+    return {'CXXFLAGS' : int_data['split_debug_flags'], 'LINKFLAGS' : int_data['split_debug_link_flags']}
+
+# Internal method
+# GCC writes the debug info of an object compiled with -gsplit-dwarf next to it;
+# SCons doesn't know these files
+def _get_split_dwarf_files(int_data, compile_objects):
+    if not _is_split_debug(int_data):
+        return []
+    return [os.path.splitext(compile_object)[0] + '.dwo' for compile_object in compile_objects]
+
+# Internal method
+# The libraries from paths_and_names['link_libraries'], as extra flags for will_compile
+def _get_link_libraries(int_data):
+    if not int_data['my_vars']['link_libraries']:
+        return {}
+    return {'LIBS' : int_data['my_vars']['link_libraries']}
+
+# External method
+# Must be called after program_compile
+def program_throughput_benchmark(int_data):
+    benchmark_arguments = _is_this_argument_passed(int_data, 'THROUGHPUT_BENCH')
+    if not benchmark_arguments:
+        return 0
+    compile_target = _get_compile_target(int_data)
+    # Next to the binary, so that each configuration of a matrix build has its own
+    result_file = myown_os_path_join(os.path.dirname(compile_target), int_data['throughput_result_file'])
+    produced_files = int_data['scons_wrappers']['will_measure_throughput'](compile_target, \
+                                                    shlex.split(benchmark_arguments), result_file)
+    _record_in_build_manifest(int_data, produced_files)
+    return 1
+
+# External method
+# Must be called after program_compile
+def program_startup_benchmark(int_data):
+    runs = _is_this_argument_passed(int_data, 'STARTUP_BENCH')
+    if not runs:
+        return 0
+    if not runs.isdigit() or int(runs) == 0:
+        exit_err_1('program_startup_benchmark ERROR: STARTUP_BENCH should be the number of runs (like 1000)')
+    compile_target = _get_compile_target(int_data)
+    # The results of all the link profiles are kept in this file, to compare them
+    result_file = myown_os_path_join(os.path.dirname(compile_target), int_data['startup_result_file'])
+    link_profile = int_data['my_vars']['link_profile'] or 'default'
+    produced_files = int_data['scons_wrappers']['will_measure_startup'](compile_target, int(runs), \
+                                                                        result_file, link_profile)
+    _record_in_build_manifest(int_data, produced_files)
+    return 1
 
 # External method
 def program_install(int_data):
-    install_source = get_myown_env_variable(int_data, 'compile_target')
-    install_target = get_myown_env_variable(int_data, 'destdir')
-    int_data['scons_wrappers']['will_install'](install_source, install_target)
+    install_source = _get_install_source(int_data)
+    install_target = int_data['got_vars']['destdir']
+    _set_install_mode(int_data)
+    if _is_split_debug(int_data) and int_data['supported_oses'][int_data['detected_os']]['packager_strips']:
+        produced_files = _install_with_split_dwarf_package(int_data, install_source, install_target)
+    elif _is_split_debug(int_data):
+        produced_files = _install_with_split_debug(int_data, install_source, install_target)
+    else:
+        produced_files = int_data['scons_wrappers']['will_install'](install_source, install_target)
+    if 'install_manifest' in int_data['paths_and_names']:
+        produced_files += _install_from_manifest(int_data)
+    _record_in_build_manifest(int_data, produced_files)
+
+# Internal method
+# The packaging tools strip the binary and extract its debug info (that is, the skeletons)
+# themselves; only the .dwo files, which they don't know about, are packed next to
+# where the debug info goes, <install_root>/lib/debug/<path of the installed binary>.dwp
+def _install_with_split_dwarf_package(int_data, install_source, install_target):
+    print('split debug: the binary is stripped by the packaging tools of ' + \
+                int_data['supported_oses'][int_data['detected_os']]['os_name'])
+    binary_name = os.path.basename(install_source)
+    installed_path = [int_data['paths_and_names']['install_path'], binary_name + '.dwp']
+    if int_data['got_vars'].get('prefix'):
+        installed_path = [int_data['got_vars']['prefix']] + installed_path
+    produced_files = int_data['scons_wrappers']['will_install'](install_source, install_target)
+    produced_files += int_data['scons_wrappers']['will_pack_split_dwarf'](install_source, \
+                myown_os_path_join(int_data['got_vars']['install_root'], int_data['debug_dir'], *installed_path))
+    return produced_files
+
+# Internal method
+# The binary is installed stripped, and its debug info goes to
+# <install_root>/lib/debug/<path of the installed binary>.debug,
+# with a link to it from <install_root>/lib/debug/.build-id/
+def _install_with_split_debug(int_data, install_source, install_target):
+    binary_name = os.path.basename(install_source)
+    debug_dir = myown_os_path_join(int_data['got_vars']['install_root'], int_data['debug_dir'])
+    installed_path = [int_data['paths_and_names']['install_path'], binary_name + '.debug']
+    if int_data['got_vars'].get('prefix'):
+        installed_path = [int_data['got_vars']['prefix']] + installed_path
+    return int_data['scons_wrappers']['will_install_split_debug'](install_source, \
+                myown_os_path_join(install_target, binary_name), \
+                myown_os_path_join(debug_dir, *installed_path), \
+                myown_os_path_join(debug_dir, '.build-id'), \
+                lambda produced_files: _record_in_build_manifest(int_data, produced_files))
+
+# Internal method
+def _read_install_manifest(int_data):
+    install_manifest = int_data['paths_and_names']['install_manifest']
+    try:
+        with open(install_manifest) as opened_file:
+            manifest = json.load(opened_file)
+    except (OSError, ValueError) as error:
+        exit_err_1('_read_install_manifest ERROR: cannot read ' + install_manifest + ': ' + str(error))
+    if not isinstance(manifest, dict) or sorted(manifest) != ['files', 'package'] or \
+                    not isinstance(manifest['package'], str) or not isinstance(manifest['files'], list):
+        exit_err_1("_read_install_manifest ERROR: " + install_manifest + " should have only keys " + \
+                                "'package' (string) and 'files' (list)")
+    for entry in manifest['files']:
+        if not isinstance(entry, dict) or 'role' not in entry or 'sources' not in entry or \
+                        not set(entry) <= set(['role', 'sources', 'base', 'subdir']):
+            exit_err_1("_read_install_manifest ERROR: each entry of 'files' should have keys " + \
+                                "'role' and 'sources' (and optional 'base' and 'subdir')")
+        if entry['role'] not in int_data['install_roles']:
+            exit_err_1('_read_install_manifest ERROR: role ' + str(entry['role']) + \
+                                ' is not one of: ' + ', '.join(int_data['install_roles']))
+        if not _is_string_or_list_of_strings(entry['sources']):
+            exit_err_1("_read_install_manifest ERROR: 'sources' is not string or list of strings")
+    return manifest
+
+# Internal method
+# Returns a list of (source file, path under install_root) pairs
+def _expand_install_entry(int_data, package, entry):
+    sources = entry['sources']
+    if isinstance(sources, str):
+        sources = [sources]
+    install_pairs = []
+    for source_glob in sources:
+        matches = sorted([match for match in glob.glob(source_glob, recursive = True) if os.path.isfile(match)])
+        if not matches:
+            exit_err_1('_expand_install_entry ERROR: no files match ' + source_glob)
+        for match in matches:
+            # The tree under 'base' is kept, otherwise the files are installed flat
+            if 'base' in entry:
+                relative = os.path.relpath(match, entry['base'])
+                if relative.startswith('..'):
+                    exit_err_1('_expand_install_entry ERROR: ' + match + ' is not under ' + entry['base'])
+            else:
+                relative = os.path.basename(match)
+            section = os.path.splitext(match)[1][1:2]
+            if entry['role'] == 'man' and not section.isdigit():
+                exit_err_1('_expand_install_entry ERROR: man page ' + match + \
+                                ' has no section (like .1) in its name')
+            role_dir = int_data['install_roles'][entry['role']].format(package = package, section = section)
+            install_pairs.append((match, [role_dir] + ([entry['subdir']] if 'subdir' in entry else []) + [relative]))
+    return install_pairs
+
+# Internal method
+# All the files of the manifest are checked and resolved together, and each of them
+# becomes its own install node (so they are installed in parallel, scons -jN)
+def _install_from_manifest(int_data):
+    manifest = _read_install_manifest(int_data)
+    install_pairs = []
+    for entry in manifest['files']:
+        install_pairs += _expand_install_entry(int_data, manifest['package'], entry)
+    install_root = int_data['got_vars']['install_root']
+    install_targets = myown_os_path_join_batch([[install_root] + install_parts \
+                                                    for install_source, install_parts in install_pairs])
+    install_sources = myown_os_path_join_batch([[install_source] for install_source, install_parts in install_pairs])
+    print('install manifest: ' + str(len(install_pairs)) + ' files')
+    return int_data['scons_wrappers']['will_install_files'](list(zip(install_sources, install_targets)))
+
+# Internal method
+def _parse_size(int_data, size):
+    match = int_data['size_pattern'].match(size)
+    if not match:
+        exit_err_1('_parse_size ERROR: ' + size + ' is not a size (like 1073741824, 1024M or 1G)')
+    return int(match.group(1)) * int_data['size_multipliers'][match.group(2).upper()]
+
+# Internal method
+def _set_install_mode(int_data):
+    install_mode = _is_this_argument_passed(int_data, 'INSTALL_MODE')
+    if not install_mode:
+        install_mode = 'copy'
+    if install_mode not in int_data['install_modes']:
+        exit_err_1('_set_install_mode ERROR: INSTALL_MODE should be one of: ' + \
+                                                ', '.join(int_data['install_modes']))
+    if int_data['detected_os'] == '':
+        _restore_detected_os(int_data)
+    # Hard links are safe only if nothing changes the installed files in place
+    allow_hardlink = 0
+    if int_data['detected_os'] and \
+            not int_data['supported_oses'][int_data['detected_os']]['staging_tree_is_rewritten']:
+        allow_hardlink = 1
+    int_data['scons_wrappers']['set_install_mode'](install_mode, allow_hardlink)
+
+# External method
+def use_build_cache(int_data):
+    cache_dir = _is_this_argument_passed(int_data, 'BUILD_CACHE')
+    if not cache_dir:
+        print('build cache is not used; pass BUILD_CACHE=/some/dir in ARGUMENTS to use it')
+        return 0
+    cache_dir = myown_os_path_join(cache_dir)
+    size = _is_this_argument_passed(int_data, 'BUILD_CACHE_SIZE')
+    if not size:
+        size = int_data['default_build_cache_size']
+    size_limit = _parse_size(int_data, size)
+    int_data['scons_wrappers']['use_cache_dir'](cache_dir, size_limit)
+    return 1
+
+# Internal method
+def _write_trace_at_exit(int_data):
+    trace_file = _is_this_argument_passed(int_data, 'TRACE')
+    if trace_file:
+        print('will write trace to ' + trace_file)
+        atexit.register(lambda: int_data['tracer']['write_trace'](trace_file))
+
+# External method
+# Must be called after get_vars('compile_vars')
+def use_incremental_mode(int_data):
+    if not _is_this_argument_passed(int_data, 'INCREMENTAL') == '1':
+        return 0
+    # The results of scanning for #include are kept only while the compile flags
+    # (that can change them, like -I or -D) are the same
+    rescan = 0
+    if 'compile_vars' not in int_data['got_vars_from_snapshot']:
+        print('compile variables have changed since the last run, all implicit dependencies are rescanned')
+        rescan = 1
+    int_data['scons_wrappers']['set_incremental_mode'](rescan)
+    return 1
+
+# External method
+# Must be called before the Environment is used (that is, before apply_vars),
+# so that the compile commands are measured
+def use_auto_jobs(int_data):
+    if not _is_this_argument_passed(int_data, 'AUTO_JOBS') == '1':
+        return 0
+    compile_memory = _read_compile_memory(int_data)
+    cpus = _get_available_cpus(int_data)
+    memory = _get_available_memory(int_data)
+    # The most memory-hungry compilation of the earlier runs is the one to plan for
+    job_memory = int_data['default_compile_memory']
+    if compile_memory:
+        job_memory = max(compile_memory.values()) * 1024
+    jobs = max(1, min(cpus, int(memory * int_data['usable_memory_share']) // job_memory))
+    print('auto jobs: %d CPUs, %d MiB of memory available, %d MiB per compilation (%s) -> -j%d' % \
+                (cpus, memory // 1024 ** 2, job_memory // 1024 ** 2, \
+                'measured' if compile_memory else 'not measured yet, assumed', jobs))
+    passed_jobs = int_data['scons_wrappers']['set_num_jobs'](jobs)
+    if passed_jobs != jobs:
+        print('auto jobs: -j' + str(passed_jobs) + ' passed on the command line is used instead')
+    int_data['scons_wrappers']['measure_compile_memory'](int_data['compile_memory_file'], compile_memory)
+    return 1
+
+# External method
+# Must be called after get_vars('compile_vars'), so that the flags are the ones
+# that are going to be used (with the ones of the link profile and of the linker)
+def probe_toolchain(int_data):
+    if _is_this_argument_passed(int_data, 'TOOLCHAIN_PROBE') == '0':
+        return 0
+    cxx = shlex.split(int_data['got_vars'].get('cpp_compiler') or int_data['default_cpp_compiler'])
+    cxx_flags = int_data['got_vars'].get('cpp_compiler_flags', '')
+    link_flags = int_data['got_vars'].get('linker_flags', '')
+    cxx_path = shutil.which(cxx[0]) if cxx else None
+    if not cxx_path:
+        exit_err_1('probe_toolchain ERROR: compiler ' + ' '.join(cxx) + ' is not found')
+    # An upgraded compiler is another binary (or at least another file)
+    cxx_path = os.path.realpath(cxx_path)
+    cxx_stat = os.stat(cxx_path)
+    compiler = ' '.join([cxx_path] + cxx[1:])
+    compiler_stat = [cxx_stat.st_size, cxx_stat.st_mtime_ns]
+    cache_key = _get_fingerprint([['compiler', compiler], ['size', compiler_stat[0]], \
+                                    ['mtime', compiler_stat[1]], ['cpp_compiler_flags', cxx_flags], \
+                                    ['linker_flags', link_flags]])
+    toolchain_cache = _read_toolchain_cache(int_data)
+    probed = toolchain_cache.get(cache_key)
+    if probed is None:
+        print('probing the toolchain: ' + ' '.join(cxx) + ' with CXXFLAGS and LDFLAGS...')
+        probed = int_data['probes']['probe_toolchain'](cxx, shlex.split(cxx_flags), shlex.split(link_flags))
+        probed['compiler'] = compiler
+        probed['compiler_stat'] = compiler_stat
+        toolchain_cache[cache_key] = probed
+        _write_toolchain_cache(int_data, toolchain_cache, compiler, compiler_stat)
+    else:
+        print('toolchain probe: the cached result is used')
+    print('toolchain: ' + probed['version'] + ' (' + cxx_path + ')')
+    print('toolchain: __cplusplus is ' + str(probed['cplusplus']) + ' with CXXFLAGS; ' + \
+                'supported standards: ' + (', '.join(probed['standards']) or 'none'))
+    for flags_name, rejected_key in [['CXXFLAGS', 'rejected_compile_flags'], ['LDFLAGS', 'rejected_link_flags']]:
+        for flag, reason in sorted(probed[rejected_key].items()):
+            print('toolchain: ' + flags_name + ' ' + flag + ' is rejected: ' + reason)
+    if probed['rejected_compile_flags'] or probed['rejected_link_flags']:
+        exit_err_1('probe_toolchain ERROR: the compiler rejects the flags above')
+    if probed['cplusplus'] < int_data['minimum_cplusplus']:
+        exit_err_1('probe_toolchain ERROR: the sources need __cplusplus ' + \
+                        str(int_data['minimum_cplusplus']) + ' or later')
+    return 1
+
+# Internal method
+# Cache key -> result of the probe (see function probe_toolchain)
+def _read_toolchain_cache(int_data):
+    toolchain_cache_file = int_data['toolchain_cache_file']
+    if not os.path.isfile(toolchain_cache_file):
+        return {}
+    try:
+        with open(toolchain_cache_file) as opened_file:
+            toolchain_cache = json.load(opened_file)
+    except ValueError:
+        print('_read_toolchain_cache WARNING: ' + toolchain_cache_file + ' is broken; ignored')
+        return {}
+    if not isinstance(toolchain_cache, dict):
+        return {}
+    return OrderedDict([(cache_key, probed) for cache_key, probed in toolchain_cache.items() \
+                                            if isinstance(probed, dict) and 'compiler' in probed])
+
+# Internal method
+# The results for the older binaries of the same compiler are dropped (they are never
+# looked up again), and only the newest int_data['toolchain_cache_entries'] are kept
+def _write_toolchain_cache(int_data, toolchain_cache, compiler, compiler_stat):
+    kept_entries = [(cache_key, probed) for cache_key, probed in toolchain_cache.items() \
+                        if probed['compiler'] != compiler or probed['compiler_stat'] == compiler_stat]
+    toolchain_cache_file = int_data['toolchain_cache_file']
+    # Written to a temporary file first, so that the cache is never half-written
+    # (the order of the entries is kept: the newest ones are the last)
+    with open(toolchain_cache_file + '.tmp', 'w') as opened_file:
+        json.dump(OrderedDict(kept_entries[-int_data['toolchain_cache_entries']:]), opened_file, indent = 1)
+    os.replace(toolchain_cache_file + '.tmp', toolchain_cache_file)
+
+# Internal method
+# Object -> peak memory (KiB) of its compilation, as measured in the earlier runs;
+# the objects that are no longer in the build manifest (nor moved aside by
+# CLEAN=outputs) are dropped, so that the sources removed since then don't count
+def _read_compile_memory(int_data):
+    compile_memory_file = int_data['compile_memory_file']
+    if not os.path.isfile(compile_memory_file):
+        return {}
+    try:
+        with open(compile_memory_file) as opened_file:
+            compile_memory = json.load(opened_file)
+    except ValueError:
+        print('_read_compile_memory WARNING: ' + compile_memory_file + ' is broken; ignored')
+        return {}
+    if not isinstance(compile_memory, dict):
+        return {}
+    known_files = dict(_read_build_manifest(int_data))
+    for stashed_file in _get_stashed_outputs(int_data):
+        known_files[os.path.relpath(stashed_file, start=int_data['clean_stash_dir'])] = 1
+    return dict([(compile_object, peak) for compile_object, peak in compile_memory.items() \
+                                            if isinstance(peak, int) and peak > 0 and compile_object in known_files])
+
+# Internal method
+# Returns the first line of a file, or '' if it can't be read
+def _read_first_line(file_path):
+    try:
+        with open(file_path) as opened_file:
+            return opened_file.readline().strip()
+    except OSError:
+        return ''
+
+# Internal method
+# The directories of the cgroup of this process, from the innermost one
+# (limits of the outer ones apply as well); these are the directories of cgroup v2,
+# the limits of cgroup v1 are read from the controllers under int_data['cgroup_root']
+# (see functions _get_available_cpus and _get_available_memory)
+def _get_cgroup_dirs(int_data):
+    cgroup_path = ''
+    try:
+        with open('/proc/self/cgroup') as opened_file:
+            for line in opened_file:
+                if line.startswith('0::'):
+                    cgroup_path = line[3:].strip()
+    except OSError:
+        return []
+    cgroup_dirs = []
+    while cgroup_path not in ['', '/']:
+        cgroup_dirs.append(os.path.join(int_data['cgroup_root'], cgroup_path.lstrip('/')))
+        cgroup_path = os.path.dirname(cgroup_path)
+    cgroup_dirs.append(int_data['cgroup_root'])
+    return cgroup_dirs
+
+# Internal method
+# CPUs this process may run on, limited by the CPU quota of the cgroups
+def _get_available_cpus(int_data):
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    for cgroup_dir in _get_cgroup_dirs(int_data):
+        cpu_max = _read_first_line(os.path.join(cgroup_dir, 'cpu.max')).split()
+        if len(cpu_max) == 2 and cpu_max[0].isdigit() and cpu_max[1].isdigit():
+            cpus = min(cpus, max(1, -(-int(cpu_max[0]) // int(cpu_max[1]))))
+    # cgroup v1
+    quota = _read_first_line(os.path.join(int_data['cgroup_root'], 'cpu', 'cpu.cfs_quota_us'))
+    period = _read_first_line(os.path.join(int_data['cgroup_root'], 'cpu', 'cpu.cfs_period_us'))
+    if quota.isdigit() and period.isdigit() and int(period):
+        cpus = min(cpus, max(1, -(-int(quota) // int(period))))
+    return cpus
+
+# Internal method
+# Bytes of memory available: on the host and under the memory limits of the cgroups
+def _get_available_memory(int_data):
+    memory = int_data['default_compile_memory'] * (os.cpu_count() or 1)
+    try:
+        with open('/proc/meminfo') as opened_file:
+            for line in opened_file:
+                if line.startswith('MemAvailable:'):
+                    memory = int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    limits = []
+    for cgroup_dir in _get_cgroup_dirs(int_data):
+        limits.append((os.path.join(cgroup_dir, 'memory.max'), os.path.join(cgroup_dir, 'memory.current')))
+    limits.append((os.path.join(int_data['cgroup_root'], 'memory', 'memory.limit_in_bytes'), \
+                    os.path.join(int_data['cgroup_root'], 'memory', 'memory.usage_in_bytes')))
+    for limit_file, usage_file in limits:
+        limit = _read_first_line(limit_file)
+        usage = _read_first_line(usage_file)
+        if limit.isdigit() and usage.isdigit():
+            memory = min(memory, max(0, int(limit) - int(usage)))
+    return memory
 
 # External method
 def is_this_option_passed(int_data, option):
@@ -332,170 +1489,443 @@ def is_install_argument_passed_and_1(int_data):
     else:
         return 0
 
+# External method
+def is_single_pass_argument_passed_and_1(int_data):
+    got_argument = _is_this_argument_passed(int_data, 'SINGLE_PASS')
+    if got_argument and got_argument == '1':
+        return 1
+    else:
+        return 0
+
 # External method
 def is_any_target_passed(int_data):
     result = int_data['scons_wrappers']['get_any_target_from_cli']()
     return result
 
+# External method
+def register_profile(int_data, post_process_funcs, os_profile):
+    _check_profile(int_data, post_process_funcs, os_profile)
+    os_key = os_profile['os']
+    if os_key in int_data['supported_oses']:
+        exit_err_1('register_profile ERROR: profile ' + os_key + ' is already registered')
+    int_data['supported_oses'][os_key] = os_profile
+    for var_key, argname in os_profile['arguments'].items():
+        int_data['arguments_index'].setdefault(argname, []).append((os_key, var_key))
+    int_data['profiles_fingerprint'] = _get_fingerprint([[int_data['profiles_fingerprint'], \
+                                                            json.dumps(os_profile, sort_keys=True)]])
+    print('registered profile: ' + os_key + ' (' + os_profile['os_name'] + ')')
+
 # Internal method
-def _get_object_file(int_data):
-    object_file = os.path.splitext(int_data['my_vars']['source_full'])[0] + '.o'
-    print('get_object_file: ' + object_file)
-    return object_file
+def _check_profile(int_data, post_process_funcs, os_profile):
+    if not isinstance(os_profile, dict):
+        exit_err_1('_check_profile ERROR: profile is not dictionary')
+    for key in int_data['profile_keys']:
+        if key not in os_profile:
+            exit_err_1('_check_profile ERROR: mandatory key ' + key + ' not found in profile')
+    for key in os_profile:
+        if key not in int_data['profile_keys']:
+            exit_err_1('_check_profile ERROR: profile key ' + key + ' is not supported')
+    got_from_arguments = []
+    for vars_dict in int_data['vars_data'].values():
+        for var_key, var_dict in vars_dict.items():
+            if var_dict['is_got_from_arguments']:
+                got_from_arguments.append(var_key)
+    for var_key in list(os_profile['arguments']) + list(os_profile['defaults']):
+        if var_key not in got_from_arguments:
+            exit_err_1('_check_profile ERROR: ' + var_key + ' in profile ' + os_profile['os'] + \
+                                                ' is not got from arguments')
+    if not os_profile['arguments'].get(int_data['os_detected_at']):
+        exit_err_1('_check_profile ERROR: ' + int_data['os_detected_at'] + \
+                                                ' is empty for ' + os_profile['os'])
+    for vars_name, funcnames in os_profile['hooks'].items():
+        if vars_name not in int_data['vars_data']:
+            exit_err_1('_check_profile ERROR: hooks for unknown variables ' + vars_name + \
+                                                ' in profile ' + os_profile['os'])
+        for funcname in funcnames:
+            if funcname not in post_process_funcs:
+                exit_err_1('_check_profile ERROR: hook ' + funcname + ' in profile ' + \
+                                                os_profile['os'] + ' is not defined')
 
 # Internal method
-def _get_install_target(int_data):
-    read_variables_cache(int_data)
-    destdir = get_myown_env_variable(int_data, 'destdir')
+def _register_profiles_from_dir(int_data, post_process_funcs):
+    for profile_file in sorted(glob.glob(os.path.join(int_data['profiles_dir'], '*.json'))):
+        with open(profile_file) as opened_file:
+            try:
+                os_profile = json.load(opened_file)
+            except ValueError as error:
+                exit_err_1('_register_profiles_from_dir ERROR: ' + profile_file + ' is broken: ' + str(error))
+        register_profile(int_data, post_process_funcs, os_profile)
 
-    if destdir:
-        install_target = myown_os_path_join(destdir, \
-                                            int_data['paths_and_names']['binary_name'])
+# Internal method
+# The hash of what makes objects different (the objects of matrix configurations
+# with the same hash are shared)
+def _get_compile_flags_hash(int_data, extra_flags):
+    compile_flags = [int_data['got_vars'].get('cpp_compiler', ''), \
+                        int_data['got_vars'].get('cpp_compiler_flags', '')] + extra_flags
+    return _get_fingerprint([compile_flags])[:16]
 
-        print('get_install_target: ' + install_target)
-        return install_target
-    else:
-        # See the comment for function clean_targets
-        print('_get_install_target WARNING: cannot get destdir')
-        return ''
+# Internal method
+def _get_object_files(int_data, sources_full):
+    object_files = []
+    for source_full in sources_full:
+        object_file = os.path.splitext(source_full)[0] + '.o'
+        if int_data['matrix_name']:
+            object_file = myown_os_path_join(int_data['paths_and_names']['compile_path'], \
+                                    'objects', _get_compile_flags_hash(int_data, []), object_file)
+        elif int_data['got_vars'].get('variant_dir'):
+            object_file = myown_os_path_join(int_data['got_vars']['variant_dir'], object_file)
+        print('get_object_file: ' + object_file)
+        object_files.append(object_file)
+    return object_files
+
+# Internal method
+# Returns the number of groups of source files for the unity build (0 if it's not used)
+def _get_unity_batches(int_data):
+    unity = _is_this_argument_passed(int_data, 'UNITY')
+    if not unity:
+        return 0
+    if unity == 'auto':
+        return int_data['scons_wrappers']['get_option_from_cli']('num_jobs')
+    if not unity.isdigit() or int(unity) < 1:
+        exit_err_1('_get_unity_batches ERROR: UNITY should be a positive number or auto')
+    return int(unity)
+
+# Internal method
+# Returns the generated group files followed by the source files excluded from the unity build
+def _get_unity_sources(int_data, sources_full, unity_batches):
+    excluded = []
+    batched = []
+    for source_full in sources_full:
+        if any([fnmatch.fnmatch(source_full, pattern) for pattern in int_data['my_vars']['unity_exclude']]):
+            print('unity build: ' + source_full + ' is excluded')
+            excluded.append(source_full)
+        else:
+            batched.append(source_full)
+    batches = [[] for number in range(unity_batches)]
+    for source_full in batched:
+        # The same source file gets into the same group, whatever the other files are
+        batches[int(_get_fingerprint([source_full]), 16) % unity_batches].append(source_full)
+    unity_dir = myown_os_path_join(int_data['paths_and_names']['compile_path'], 'unity', str(unity_batches))
+    unity_sources = []
+    for number, batch in enumerate(batches):
+        if not batch:
+            continue
+        unity_source = myown_os_path_join(unity_dir, 'unity_' + str(number) + '.cpp')
+        _write_unity_source(unity_source, batch)
+        unity_sources.append(unity_source)
+    print('unity build: ' + str(len(batched)) + ' source files in ' + str(len(unity_sources)) + ' groups')
+    # Group files are not built by SCons, but they should be cleaned
+    _record_in_build_manifest(int_data, unity_sources)
+    return unity_sources + excluded
+
+# Internal method
+# The file is not touched when its contents are the same (so it's not recompiled)
+def _write_unity_source(unity_source, batch):
+    unity_dir = os.path.dirname(unity_source)
+    contents = '// Generated for UNITY=... (see helpers.py), do not edit\n' + \
+                    ''.join(['#include "' + os.path.relpath(source_full, unity_dir) + '"\n' \
+                                for source_full in batch])
+    try:
+        with open(unity_source) as opened_file:
+            if opened_file.read() == contents:
+                return
+    except OSError:
+        pass
+    print('unity build: writing ' + unity_source)
+    os.makedirs(unity_dir, exist_ok = True)
+    with open(unity_source, 'w') as opened_file:
+        opened_file.write(contents)
+
+# Internal method
+# Returns a list of pairs (precompiled header, header); a header is precompiled
+# separately for each combination of the compiler and its flags
+# (including extra_flags, the ones added by this script, see function _program_compile_with_profile)
+def _get_precompiled_headers(int_data, extra_flags):
+    precompiled_headers = []
+    # Under the build directory (of the active variant, if any), not next to the headers
+    pch_dir = myown_os_path_join(int_data['got_vars'].get('variant_dir') or \
+                                int_data['paths_and_names']['compile_path'], \
+                                'pch', _get_compile_flags_hash(int_data, extra_flags))
+    for prefix_header in int_data['my_vars']['prefix_headers']:
+        # The headers are included by their names (see function _will_precompile_headers in wrappers.py)
+        precompiled_header = myown_os_path_join(pch_dir, os.path.basename(prefix_header) + '.gch')
+        print('get_precompiled_header: ' + precompiled_header)
+        precompiled_headers.append((precompiled_header, prefix_header))
+    return precompiled_headers
+
+# Internal method
+def _read_matrix_configs(int_data, matrix_file):
+    try:
+        with open(matrix_file) as opened_file:
+            matrix_configs = json.load(opened_file)
+    except (OSError, ValueError) as error:
+        exit_err_1('_read_matrix_configs ERROR: cannot read ' + matrix_file + ': ' + str(error))
+    if not isinstance(matrix_configs, list) or not matrix_configs:
+        exit_err_1('_read_matrix_configs ERROR: ' + matrix_file + ' is not non-empty list')
+    matrix_names = []
+    for matrix_config in matrix_configs:
+        if not isinstance(matrix_config, dict) or sorted(matrix_config) != ['arguments', 'name']:
+            exit_err_1("_read_matrix_configs ERROR: each configuration should have " + \
+                                        "only keys 'name' and 'arguments'")
+        myown_os_path_join(matrix_config['name'])
+        if matrix_config['name'] in matrix_names:
+            exit_err_1('_read_matrix_configs ERROR: configuration ' + matrix_config['name'] + \
+                                        ' is defined twice')
+        matrix_names.append(matrix_config['name'])
+        if not isinstance(matrix_config['arguments'], dict):
+            exit_err_1('_read_matrix_configs ERROR: arguments of configuration ' + \
+                                        matrix_config['name'] + ' is not dictionary')
+    return matrix_configs
 
 # External method
-# When cleaning, passing to scons whatever arguments (like DESTDIR=...) doesn't have any effect.
-def clean_targets(targets_to_clean):
-    for callback in targets_to_clean:
-        somepath = callback()
+# Returns helpers for each configuration of the matrix file passed as MATRIX=...,
+# or an empty list if it is not passed. Each configuration is resolved from its own
+# 'arguments' (plus the passed arguments that are not in any OS profile, like INSTALL),
+# and gets its own Environment and output directory, in one dependency graph.
+def get_matrix_helpers(int_data):
+    matrix_file = _is_this_argument_passed(int_data, 'MATRIX')
+    if not matrix_file:
+        return []
+    matrix_helpers = []
+    for matrix_config in _read_matrix_configs(int_data, matrix_file):
+        print('matrix configuration: ' + matrix_config['name'])
+        matrix_helpers.append(_ext_methods(*_internal_data(int_data['paths_and_names'], \
+                                                int_data['tracer'], int_data, matrix_config)))
+    return matrix_helpers
 
-        # No directories should be deleted, only files
-        if os.path.isfile(somepath):
+# Internal method
+# The build manifest is the list of all the files produced by compile and install runs
+# (one path per line), so that cleaning doesn't need to know how they were produced
+def _read_build_manifest(int_data):
+    if int_data['manifest_entries'] is None:
+        int_data['manifest_entries'] = OrderedDict()
+        if os.path.isfile(int_data['build_manifest_file']):
+            with open(int_data['build_manifest_file']) as manifest_file:
+                for line in manifest_file:
+                    if line.rstrip('\n'):
+                        int_data['manifest_entries'][line.rstrip('\n')] = 1
+    return int_data['manifest_entries']
 
-            # No files outside the current directory should be deleted
-            target_to_clean = os.path.relpath(somepath, start=os.curdir)
+# Internal method
+def _record_in_build_manifest(int_data, produced_files):
+    manifest_entries = _read_build_manifest(int_data)
+    new_entries = []
+    for produced_file in _restore_stashed_outputs(int_data) + produced_files:
+        if produced_file not in manifest_entries:
+            manifest_entries[produced_file] = 1
+            new_entries.append(produced_file)
+    if new_entries:
+        with open(int_data['build_manifest_file'], 'a') as manifest_file:
+            manifest_file.write(''.join([entry + '\n' for entry in new_entries]))
 
-            if target_to_clean:
-                print('deleting target: ' + target_to_clean)
-                os.unlink(target_to_clean)
-            else:
-                print('clean_targets WARNING: ' + target_to_clean + \
-                                        ' seems to be OUTSIDE the current directory! not cleaned')
-                continue
-        else:
-            print('clean_targets WARNING: ' + somepath + ' is not file! not cleaned')
+# Internal method
+# The files moved aside by 'scons -c CLEAN=outputs' are all moved back (and recorded
+# in the build manifest again) by the first run that records its files, before SCons
+# decides what to build; with the SCons database kept, the ones whose sources,
+# flags and dependencies are the same are not built again.
+# Returns the restored files
+def _restore_stashed_outputs(int_data):
+    stash_dir = int_data['clean_stash_dir']
+    if not os.path.isdir(stash_dir):
+        return []
+    restored = []
+    for stashed_file in _get_stashed_outputs(int_data):
+        produced_file = os.path.relpath(stashed_file, start=stash_dir)
+        # A file that is already there again is newer than the stashed one
+        if os.path.exists(produced_file):
             continue
+        os.makedirs(os.path.dirname(os.path.abspath(produced_file)), exist_ok = True)
+        os.replace(stashed_file, produced_file)
+        restored.append(produced_file)
+    shutil.rmtree(stash_dir)
+    if restored:
+        print('restored ' + str(len(restored)) + ' files kept by cleaning from ' + stash_dir)
+    return restored
+
+# Internal method
+# Returns the files to clean, what to do with each of them and how it's called
+def _get_clean_actions(int_data, targets_to_clean):
+    clean_mode = _is_this_argument_passed(int_data, 'CLEAN') or 'all'
+    if clean_mode not in int_data['clean_modes']:
+        exit_err_1('_get_clean_actions ERROR: CLEAN should be one of: ' + ', '.join(int_data['clean_modes']))
+    if clean_mode == 'all':
+        return targets_to_clean, os.unlink, 'deleting'
+    if clean_mode == 'variant':
+        return (lambda: _get_active_variant_files(int_data),), os.unlink, 'deleting'
+    # The SCons database, the variables cache and the measured compile memory are kept;
+    # the produced files are moved aside (see function _restore_stashed_outputs)
+    print('cleaning outputs only: ' + int_data['scons_db_file'] + ' and ' + \
+                    int_data['variables_cache_file'] + ' are kept, built files are moved to ' + \
+                    int_data['clean_stash_dir'])
+    outputs_to_clean = (
+        lambda: list(_read_build_manifest(int_data)),
+        lambda: [int_data['build_manifest_file']]
+    )
+    return outputs_to_clean, lambda target_to_clean: _stash_output(int_data, target_to_clean), 'moving aside'
+
+# Internal method
+# The files of the build manifest that are in the variant of the last COMPILE run
+def _get_active_variant_files(int_data):
+    read_variables_cache(int_data)
+    variant_dir = int_data['snapshot'].get('vars', {}).get('compile_vars', {}).get('got_vars', {}).get('variant_dir')
+    if not variant_dir:
+        exit_err_1('_get_active_variant_files ERROR: the last COMPILE run was not with VARIANTS=1')
+    print('cleaning variant ' + variant_dir + ' only')
+    return [produced_file for produced_file in _read_build_manifest(int_data) \
+                                if produced_file.startswith(variant_dir + '/')]
+
+# Internal method
+def _stash_output(int_data, target_to_clean):
+    if target_to_clean == int_data['build_manifest_file']:
+        os.unlink(target_to_clean)
+        return
+    stashed_file = os.path.join(int_data['clean_stash_dir'], target_to_clean)
+    os.makedirs(os.path.dirname(stashed_file), exist_ok = True)
+    os.replace(target_to_clean, stashed_file)
+
+# Internal method
+# The files moved aside by the earlier cleaning with CLEAN=outputs
+def _get_stashed_outputs(int_data):
+    stashed_files = []
+    for stash_root, stash_dirs, stash_files in os.walk(int_data['clean_stash_dir']):
+        stashed_files += [os.path.join(stash_root, stash_file) for stash_file in stash_files]
+    return stashed_files
+
+# External method
+# When cleaning, passing to scons whatever arguments (like DESTDIR=...) doesn't have any effect:
+# everything is taken from the build manifest (except CLEAN, see function _get_clean_actions).
+def clean_targets(int_data, targets_to_clean):
+    targets_to_clean, clean_action, clean_action_name = _get_clean_actions(int_data, targets_to_clean)
+    somepaths = OrderedDict()
+    for callback in targets_to_clean:
+        for somepath in callback():
+            somepaths[somepath] = 1
+
+    project_dir = os.path.realpath(os.curdir)
+    targets = []
+    absent = 0
+    for somepath in somepaths:
+        # No directories should be deleted, only files (and links, like the ones to debug files)
+        if not os.path.isfile(somepath) and not os.path.islink(somepath):
+            absent += 1
+            continue
+        # No files outside the current directory should be deleted
+        target_dir = os.path.realpath(os.path.dirname(os.path.abspath(somepath)))
+        if target_dir != project_dir and not target_dir.startswith(project_dir + os.sep):
+            print('clean_targets WARNING: ' + somepath + \
+                                    ' is OUTSIDE the current directory! not cleaned')
+            continue
+        target_to_clean = os.path.relpath(somepath, start=os.curdir)
+        print(clean_action_name + ' target: ' + target_to_clean)
+        targets.append(target_to_clean)
+
+    # Many files are deleted in parallel
+    if len(targets) >= int_data['parallel_clean_threshold']:
+        with concurrent.futures.ThreadPoolExecutor(max_workers = int_data['clean_workers']) as executor:
+            list(executor.map(clean_action, targets))
+    else:
+        for target_to_clean in targets:
+            clean_action(target_to_clean)
+    print('clean_targets: ' + str(len(targets)) + ' files cleaned, ' + str(absent) + ' already absent')
 
 # ========== (DATA) CONSTRUCTOR ==========
 
-def _populate_supported_oses(vars_data, supported_oses, os_detected_at):
-    for supported_oses_key in supported_oses:
-        # Otherwise here is
-        # "dictionary changed size during iteration" RuntimeError
-        supported_oses_dict = supported_oses[supported_oses_key]
-        for vars_key in vars_data:
-            vars_dict = vars_data[vars_key]
-            for var_key in vars_dict:
-                var_dict = vars_dict[var_key]
-                if var_dict['is_got_from_arguments']:
-                    for key in var_dict['is_got_from_arguments']:
-                        if key == supported_oses_key:
-                            # Otherwise here is
-                            # "dictionary changed size during iteration" RuntimeError
-                            supported_oses_dict[var_key] = \
-                                                var_dict['is_got_from_arguments'][key]
-                    if var_key == os_detected_at and supported_oses_dict[var_key] == '':
-                        exit_err_1('_populate_supported_oses ERROR: ' + var_key + \
-                                                ' is empty for ' + supported_oses_key)
-
-def _populate_myown_env_variables_descriptions(vars_data, myown_env_variables_descriptions):
-    for vars_key in vars_data:
-        vars_data_dict = vars_data[vars_key]
-        for var_key in vars_data_dict:
-            os_var_dict = vars_data_dict[var_key]
-            if os_var_dict['is_saved_to_cache_file']:
-                myown_env_variables_descriptions[var_key] = \
-                                                os_var_dict['is_saved_to_cache_file']
-
-def _define_vars_data(os_detected_at):
+def _define_vars_data():
     vars_data = {
-        # All that I add to env variables must be defined
-        # in values of 'is_saved_to_cache_file' here
+        # All the got variables are saved to the variables cache (snapshot);
+        # 'is_required_in_cache' describes the ones without which
+        # the snapshot is not considered usable (see function are_vars_cached)
         'install_vars' : OrderedDict(),
         'compile_vars' : {}
     }
 
     vars_data['install_vars']['destdir'] = {
-            'is_got_from_arguments' : {'gentoo' : 'DESTDIR', 'debian-based' : 'install_root', 'rpm-based': 'BUILDROOT'},
+            'is_got_from_arguments' : 1,
             'is_applied_to_scons_env' : '',
-            'is_saved_to_cache_file' : ('MYCACHEDDIR', \
-                            "cached 'dir' argument for " + \
-                            "env.Install", ''),
+            'is_required_in_cache' : "cached 'dir' argument for env.Install",
             'is_post_processed_in_a_function' : 'reset_destdir'
     }
     vars_data['install_vars']['prefix'] = {
-            'is_got_from_arguments' : {'gentoo' : 'PREFIX', 'debian-based' : 'prefix', 'rpm-based': 'PREFIX'},
+            'is_got_from_arguments' : 1,
             'is_applied_to_scons_env' : '',
-            'is_saved_to_cache_file' : '',
+            'is_required_in_cache' : '',
             'is_post_processed_in_a_function' : ''
     }
     vars_data['install_vars']['compile_target'] = {
             'is_got_from_arguments' : '',
             'is_applied_to_scons_env' : '',
-            'is_saved_to_cache_file' : ('MYCACHEDSOURCE', \
-                            "cached 'source' argument for " + \
-                            "env.Install", ''),
+            'is_required_in_cache' : "cached 'source' argument for env.Install",
+            'is_post_processed_in_a_function' : ''
+    }
+    # Is set in function _reset_destdir
+    vars_data['install_vars']['install_root'] = {
+            'is_got_from_arguments' : '',
+            'is_applied_to_scons_env' : '',
+            'is_required_in_cache' : "cached root for the install manifest",
             'is_post_processed_in_a_function' : ''
     }
     vars_data['compile_vars'] = {
         'cpp_compiler' : {
-            'is_got_from_arguments' : {'gentoo' : 'CXX', 'debian-based' : 'CXX', 'rpm-based': 'CXX'},
+            'is_got_from_arguments' : 1,
             'is_applied_to_scons_env' : 'CXX',
-            'is_saved_to_cache_file' : '',
+            'is_required_in_cache' : '',
             'is_post_processed_in_a_function' : ''
         },
         'cpp_compiler_flags' : {
-            'is_got_from_arguments' : {'gentoo' : 'CXXFLAGS', 'debian-based' : 'CXXFLAGS', 'rpm-based': 'CXXFLAGS'},
+            'is_got_from_arguments' : 1,
             'is_applied_to_scons_env' : 'CXXFLAGS',
-            'is_saved_to_cache_file' : '',
+            'is_required_in_cache' : '',
             'is_post_processed_in_a_function' : ''
         },
         'linker_flags' : {
-            'is_got_from_arguments' : {'gentoo' : 'LDFLAGS', 'debian-based' : 'LDFLAGS', 'rpm-based': 'LDFLAGS'},
+            'is_got_from_arguments' : 1,
             'is_applied_to_scons_env' : 'LINKFLAGS',
-            'is_saved_to_cache_file' : '',
+            'is_required_in_cache' : '',
             'is_post_processed_in_a_function' : ''
         },
-        'source_full' : {
+        'sources_full' : {
             'is_got_from_arguments' : '',
             'is_applied_to_scons_env' : '',
-            'is_saved_to_cache_file' : '',
+            'is_required_in_cache' : '',
             'is_post_processed_in_a_function' : ''
+        },
+        # Changes linker_flags (see function _apply_link_profile)
+        'link_profile' : {
+            'is_got_from_arguments' : '',
+            'is_applied_to_scons_env' : '',
+            'is_required_in_cache' : '',
+            'is_post_processed_in_a_function' : 'apply_link_profile'
+        },
+        # Changes linker_flags (see function _select_linker), after the link profile
+        'linker' : {
+            'is_got_from_arguments' : '',
+            'is_applied_to_scons_env' : '',
+            'is_required_in_cache' : '',
+            'is_post_processed_in_a_function' : 'select_linker'
+        },
+        # Depends on all the compile variables above (see function _select_variant_dir)
+        'variant_dir' : {
+            'is_got_from_arguments' : '',
+            'is_applied_to_scons_env' : '',
+            'is_required_in_cache' : '',
+            'is_post_processed_in_a_function' : 'select_variant_dir'
         }
     }
 
-    supported_oses = OrderedDict()
-    # Is populated further in function _populate_supported_oses
-    supported_oses['gentoo'] = {
-        'os_name' : 'Gentoo'
-    }
-    supported_oses['debian-based'] = {
-        'os_name' : 'Debian-based Distro'
-    }
-    supported_oses['rpm-based'] = {
-        'os_name' : 'RPM-based Distro'
-    }
-    _populate_supported_oses(vars_data, supported_oses, os_detected_at)
-    # Uncomment to look at the dictionary
-    # print('supported_oses dictionary dump:')
-    # print(supported_oses)
+    return vars_data
 
-    # Is populated further in function _populate_myown_env_variables_descriptions
-    myown_env_variables_descriptions = {}
-    _populate_myown_env_variables_descriptions(vars_data, myown_env_variables_descriptions)
-    # Uncomment to look at the dictionary
-    # print('myown_env_variables_descriptions dictionary dump:')
-    # print(myown_env_variables_descriptions)
-
-    return vars_data, supported_oses, myown_env_variables_descriptions
+# A string or a non-empty list of non-empty strings
+def _is_string_or_list_of_strings(value):
+    if isinstance(value, str):
+        return 1
+    if isinstance(value, list) and value:
+        for item in value:
+            if not isinstance(item, str) or not item:
+                return 0
+        return 1
+    return 0
 
-def _check_paths_and_names(paths_and_names, mandatory_pnn_keys):
+def _check_paths_and_names(paths_and_names, mandatory_pnn_keys, optional_pnn_keys, listable_pnn_keys):
     if not isinstance(paths_and_names, dict):
         exit_err_1('_check_paths_and_names ERROR: paths_and_names is not dictionary')
     for mandatory_key in mandatory_pnn_keys:
@@ -503,56 +1933,289 @@ def _check_paths_and_names(paths_and_names, mandatory_pnn_keys):
             exit_err_1('_check_paths_and_names ERROR: mandatory key ' + mandatory_key + ' not found in paths_and_names')
         if not paths_and_names[mandatory_key]:
             exit_err_1("_check_paths_and_names ERROR: paths_and_names['" + mandatory_key + "'] is false")
-        if not isinstance(paths_and_names[mandatory_key], str):
+        if mandatory_key in listable_pnn_keys:
+            if not _is_string_or_list_of_strings(paths_and_names[mandatory_key]):
+                exit_err_1("_check_paths_and_names ERROR: paths_and_names['" + mandatory_key + "'] is not string or list of strings")
+        elif not isinstance(paths_and_names[mandatory_key], str):
             exit_err_1("_check_paths_and_names ERROR: paths_and_names['" + mandatory_key + "'] is not string")
     for pnn_key in paths_and_names:
-        if not pnn_key in mandatory_pnn_keys:
+        if not pnn_key in mandatory_pnn_keys and not pnn_key in optional_pnn_keys:
             exit_err_1('_check_paths_and_names ERROR: paths_and_names key ' + pnn_key + ' is not supported')
-
-def _internal_data(paths_and_names):
+    if 'source_set' in paths_and_names:
+        if not isinstance(paths_and_names['source_set'], dict) or not paths_and_names['source_set']:
+            exit_err_1("_check_paths_and_names ERROR: paths_and_names['source_set'] is not non-empty dictionary")
+        for source_dir, source_names in paths_and_names['source_set'].items():
+            if not _is_string_or_list_of_strings(source_names):
+                exit_err_1("_check_paths_and_names ERROR: paths_and_names['source_set']['" + \
+                                                source_dir + "'] is not string or list of strings")
+    for listable_key in ['prefix_headers', 'unity_exclude', 'link_libraries']:
+        if listable_key in paths_and_names:
+            if not _is_string_or_list_of_strings(paths_and_names[listable_key]):
+                exit_err_1("_check_paths_and_names ERROR: paths_and_names['" + listable_key + \
+                                                "'] is not string or list of strings")
+    if 'install_manifest' in paths_and_names and not isinstance(paths_and_names['install_manifest'], str):
+        exit_err_1("_check_paths_and_names ERROR: paths_and_names['install_manifest'] is not string")
+
+# Expands file names and globs of one directory into a sorted list of paths
+def _expand_source_dir(source_dir, source_names):
+    if isinstance(source_names, str):
+        source_names = [source_names]
+    source_dir = myown_os_path_join(source_dir)
+    expanded = []
+    for source_name in source_names:
+        if glob.has_magic(source_name):
+            matches = sorted(glob.glob(os.path.join(source_dir, source_name)))
+            if not matches:
+                exit_err_1('_expand_source_dir ERROR: no files match ' + source_name + ' in ' + source_dir)
+            for match in matches:
+                expanded.append(myown_os_path_join(match))
+        else:
+            expanded.append(myown_os_path_join(source_dir, source_name))
+    return expanded
+
+def _expand_sources(paths_and_names):
+    sources_full = _expand_source_dir(paths_and_names['source_path'], paths_and_names['source_name'])
+    if 'source_set' in paths_and_names:
+        for source_dir, source_names in paths_and_names['source_set'].items():
+            sources_full += _expand_source_dir(source_dir, source_names)
+    # The same file can be matched in several ways; every file is compiled once
+    unique_sources = []
+    for source_full in sources_full:
+        if source_full not in unique_sources:
+            unique_sources.append(source_full)
+    return unique_sources
+
+def _get_unity_exclude(paths_and_names):
+    unity_exclude = paths_and_names.get('unity_exclude', [])
+    if isinstance(unity_exclude, str):
+        unity_exclude = [unity_exclude]
+    # Globs can't be checked by myown_os_path_join
+    return [os.path.normpath(pattern) for pattern in unity_exclude]
+
+def _get_link_libraries_names(paths_and_names):
+    link_libraries = paths_and_names.get('link_libraries', [])
+    if isinstance(link_libraries, str):
+        link_libraries = [link_libraries]
+    return link_libraries
+
+def _expand_prefix_headers(paths_and_names):
+    prefix_headers = paths_and_names.get('prefix_headers', [])
+    if isinstance(prefix_headers, str):
+        prefix_headers = [prefix_headers]
+    header_names = [os.path.basename(prefix_header) for prefix_header in prefix_headers]
+    if len(set(header_names)) != len(header_names):
+        exit_err_1('_expand_prefix_headers ERROR: the names of prefix headers must differ (they are ' + \
+                        'precompiled into one directory)')
+    expanded = []
+    for prefix_header in prefix_headers:
+        prefix_header = myown_os_path_join(prefix_header)
+        if not os.path.isfile(prefix_header):
+            exit_err_1('_expand_prefix_headers ERROR: prefix header ' + prefix_header + ' not found')
+        expanded.append(prefix_header)
+    return expanded
+
+# LINK_PROFILE is a "ready value", so that changing it makes compile_vars stale
+def _get_link_profile(mydata):
+    link_profile = mydata['scons_wrappers']['get_argument_from_cli']('LINK_PROFILE') or ''
+    if link_profile and link_profile not in mydata['link_profiles']:
+        exit_err_1('_get_link_profile ERROR: LINK_PROFILE should be one of: ' + \
+                                                ', '.join(sorted(mydata['link_profiles'])))
+    return link_profile
+
+# LINKER is a "ready value" too; the linker that is really used is got in function _select_linker
+def _get_linker(mydata):
+    linker = mydata['scons_wrappers']['get_argument_from_cli']('LINKER') or ''
+    if linker and linker not in ['auto', 'default'] + mydata['linkers']:
+        exit_err_1('_get_linker ERROR: LINKER should be one of: ' + ', '.join(['auto', 'default'] + mydata['linkers']))
+    return linker
+
+# parent_data and matrix_config are passed for configurations of a matrix build only
+# (see function get_matrix_helpers)
+def _internal_data(paths_and_names, tracer, parent_data = None, matrix_config = None):
     mydata = {}
 
+    mydata['tracer'] = tracer
+
     mydata['mandatory_pnn_keys'] = ['source_path', 'source_name', 'compile_path', 'install_path', 'binary_name']
-    _check_paths_and_names(paths_and_names, mydata['mandatory_pnn_keys'])
+    mydata['optional_pnn_keys'] = ['source_set', 'prefix_headers', 'unity_exclude', 'install_manifest', \
+                                    'link_libraries']
+    # These keys can be lists of strings as well
+    mydata['listable_pnn_keys'] = ['source_name', 'prefix_headers', 'unity_exclude', 'link_libraries']
+    _check_paths_and_names(paths_and_names, mydata['mandatory_pnn_keys'], \
+                            mydata['optional_pnn_keys'], mydata['listable_pnn_keys'])
     mydata['paths_and_names'] = paths_and_names
 
-    variables_cache_file = 'scons_variables_cache.conf'
-    mydata['variables_cache_file'] = variables_cache_file
-    mydata['scons_wrappers'] = wrappers_class(variables_cache_file)
+    mydata['variables_cache_file'] = 'scons_config_snapshot.json'
+    # Is changed when the structure of the snapshot changes (older snapshots are ignored)
+    mydata['snapshot_format'] = 2
+    if matrix_config:
+        mydata['matrix_name'] = matrix_config['name']
+        arguments = {}
+        for argname, argvalue in parent_data['scons_wrappers']['get_arguments_from_cli']().items():
+            if argname not in parent_data['arguments_index']:
+                arguments[argname] = argvalue
+        arguments.update(matrix_config['arguments'])
+        mydata['scons_wrappers'] = parent_data['scons_wrappers']['new_matrix_wrappers'](arguments)
+    else:
+        mydata['matrix_name'] = ''
+        mydata['scons_wrappers'] = wrappers_class(tracer)
 
     mydata['scons_db_file'] = '.sconsign.dblite'
 
+    mydata['build_manifest_file'] = '.scons_build_manifest'
+    # Is populated in function _read_build_manifest (the same for all matrix configurations)
+    mydata['manifest_entries'] = None
+    if parent_data:
+        mydata['manifest_entries'] = _read_build_manifest(parent_data)
+    # See function clean_targets
+    mydata['clean_modes'] = ['all', 'outputs', 'variant']
+    # For CLEAN=outputs (see function _get_clean_actions)
+    mydata['clean_stash_dir'] = myown_os_path_join(paths_and_names['compile_path'], '.scons_clean_stash')
+    mydata['parallel_clean_threshold'] = 64
+    mydata['clean_workers'] = min(32, os.cpu_count() or 1)
+
+    # For INSTALL_MODE (see function _set_install_mode)
+    mydata['install_modes'] = ['copy', 'link']
+
+    # Role of the files in the install manifest -> directory under install_root
+    # (see function _expand_install_entry)
+    mydata['install_roles'] = {
+        'bin' : 'bin',
+        'lib' : 'lib',
+        'share' : 'share/{package}',
+        'doc' : 'share/doc/{package}',
+        'man' : 'share/man/man{section}'
+    }
+
+    # For PGO=1 (see function _program_compile_with_profile); added to CXXFLAGS/LDFLAGS
+    mydata['profile_generate_flags'] = ['-fprofile-generate']
+    # (-Wmissing-profile is not disabled: it's the only warning about a profile that is not used)
+    mydata['profile_use_flags'] = ['-fprofile-use', '-fprofile-correction', '-flto=auto']
+    mydata['profile_use_link_flags'] = ['-flto=auto']
+
+    # For SPLIT_DEBUG=1 (see functions _get_split_debug_flags and _install_with_split_debug);
+    # dwp of binutils can't read the split units of DWARF 5 (the default of GCC 11+)
+    mydata['split_debug_flags'] = ['-gsplit-dwarf', '-gdwarf-4']
+    mydata['split_debug_link_flags'] = ['-Wl,--build-id']
+    # Under install_root
+    mydata['debug_dir'] = 'lib/debug'
+
+    # For VARIANTS=1 (see function _select_variant_dir), under compile_path
+    mydata['variants_dir'] = 'variants'
+
+    # For LINKER (see function _select_linker); from the fastest one, for -fuse-ld=
+    mydata['linkers'] = ['mold', 'lld', 'gold', 'bfd']
+    # The same as in SCons tool g++, when CXX is not passed
+    mydata['default_cpp_compiler'] = 'g++'
+    mydata['probes'] = probes_class()
+
+    # For THROUGHPUT_BENCH and STARTUP_BENCH (see functions program_throughput_benchmark
+    # and program_startup_benchmark)
+    mydata['throughput_result_file'] = 'throughput.json'
+    mydata['startup_result_file'] = 'startup.json'
+
+    # For LINK_PROFILE (see function _apply_link_profile); added to LDFLAGS
+    minimal_link_flags = ['-Wl,--as-needed', '-Wl,-O1', '-Wl,--hash-style=gnu', \
+                            '-Wl,-z,combreloc', '-Wl,--sort-common']
+    mydata['link_profiles'] = {
+        'minimal' : minimal_link_flags,
+        'minimal-static' : minimal_link_flags + ['-static-libstdc++', '-static-libgcc']
+    }
+
+    # For AUTO_JOBS (see function use_auto_jobs); the file is next to the variables cache
+    mydata['compile_memory_file'] = 'scons_compile_memory.json'
+    # What a compilation is assumed to take until it's measured
+    mydata['default_compile_memory'] = 512 * 1024 ** 2
+    # The rest is left for the linker, SCons itself and everything else on the host
+    mydata['usable_memory_share'] = 0.8
+    mydata['cgroup_root'] = '/sys/fs/cgroup'
+
+    # For the toolchain probe (see function probe_toolchain); the file is next to the variables cache
+    mydata['toolchain_cache_file'] = 'scons_toolchain_cache.json'
+    # The number of compilers and flags the results are kept for
+    mydata['toolchain_cache_entries'] = 16
+    # The sources use C++11
+    mydata['minimum_cplusplus'] = 201103
+
+    # For BUILD_CACHE_SIZE (see function use_build_cache)
+    mydata['default_build_cache_size'] = '1G'
+    mydata['size_pattern'] = re.compile('^([0-9]+)([kKmMgG]?)$')
+    mydata['size_multipliers'] = {'' : 1, 'K' : 1024, 'M' : 1024 ** 2, 'G' : 1024 ** 3}
+
     mydata['os_detected_at'] = 'destdir'
-    mydata['vars_data'], mydata['supported_oses'], mydata['myown_env_variables'] = \
-                            _define_vars_data(mydata['os_detected_at'])
+    mydata['vars_data'] = _define_vars_data()
+
+    # Is populated in function register_profile
+    mydata['supported_oses'] = OrderedDict()
+    # Argument name -> list of pairs (OS, variable); is populated in function register_profile
+    mydata['arguments_index'] = {}
+    mydata['profiles_fingerprint'] = ''
+    mydata['profile_keys'] = ['os', 'os_name', 'arguments', 'defaults', 'hooks', 'staging_tree_is_rewritten', \
+                                'packager_strips']
+    mydata['profiles_dir'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
 
     # These are "ready values" for variables not got from ARGUMENTS
     # (see FACADE in function get_vars)
     mydata['my_vars'] = {
-        'source_full' : myown_os_path_join(mydata['paths_and_names']['source_path'], \
-                                                mydata['paths_and_names']['source_name']),
+        'sources_full' : _expand_sources(mydata['paths_and_names']),
+        'prefix_headers' : _expand_prefix_headers(mydata['paths_and_names']),
+        'unity_exclude' : _get_unity_exclude(mydata['paths_and_names']),
+        'link_libraries' : _get_link_libraries_names(mydata['paths_and_names']),
         'compile_target' : myown_os_path_join(mydata['paths_and_names']['compile_path'], \
-                                                mydata['paths_and_names']['binary_name'])
+                                                mydata['paths_and_names']['binary_name']),
+        # Is set in function _reset_destdir
+        'install_root' : '',
+        'link_profile' : _get_link_profile(mydata),
+        'linker' : _get_linker(mydata),
+        # Is set in function _select_variant_dir; the value here only tells whether to use variants
+        'variant_dir' : 'auto' if mydata['scons_wrappers']['get_argument_from_cli']('VARIANTS') == '1' \
+                                    and not mydata['matrix_name'] else ''
     }
+    if mydata['matrix_name']:
+        mydata['my_vars']['compile_target'] = myown_os_path_join( \
+                                                mydata['paths_and_names']['compile_path'], \
+                                                'matrix', mydata['matrix_name'], \
+                                                mydata['paths_and_names']['binary_name'])
 
     # Set in function _detect_os
     mydata['detected_os'] = ''
 
+    # Set in function read_variables_cache (the cache is read only once per run)
+    mydata['variables_cache_read'] = 0
+    mydata['snapshot'] = {}
+
     # Values are set in function get_vars
     mydata['got_vars'] = {}
+    # Names of the groups of variables got in this run (to be saved to the snapshot)
+    mydata['got_vars_names'] = OrderedDict()
+    # Names of the groups of variables taken from the snapshot in this run
+    mydata['got_vars_from_snapshot'] = {}
 
     # Contains internal methods that are called in internal method _launch_post_process
     post_process_funcs = {
-        'reset_destdir' : lambda: _reset_destdir(mydata)
+        'reset_destdir' : lambda: _reset_destdir(mydata),
+        'apply_link_profile' : lambda: _apply_link_profile(mydata),
+        'select_linker' : lambda: _select_linker(mydata),
+        'select_variant_dir' : lambda: _select_variant_dir(mydata)
     }
 
-    # Contains differents callbacks (including internal methods) that are called in external method clean_targets
+    # Contains differents callbacks (including internal methods) that are called in external method clean_targets;
+    # each callback returns a list of paths
     targets_to_clean = (
-        lambda: mydata['scons_db_file'],
-        lambda: _get_object_file(mydata),
-        lambda: mydata['my_vars']['compile_target'],
-        lambda: _get_install_target(mydata),
-        lambda: mydata['variables_cache_file']
+        lambda: [mydata['scons_db_file']],
+        lambda: list(_read_build_manifest(mydata)),
+        lambda: [mydata['variables_cache_file']],
+        lambda: [mydata['compile_memory_file']],
+        lambda: [mydata['toolchain_cache_file']],
+        lambda: _get_stashed_outputs(mydata),
+        lambda: [mydata['build_manifest_file']]
     )
 
+    if parent_data:
+        # The profiles are already registered
+        for key in ['supported_oses', 'arguments_index', 'profiles_fingerprint']:
+            mydata[key] = parent_data[key]
+    else:
+        _register_profiles_from_dir(mydata, post_process_funcs)
+
     return mydata, post_process_funcs, targets_to_clean
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Probes of the toolchain: small compile and link runs that tell what works
+with the given compiler and flags, run concurrently in a temporary directory.
+
+See LINKER=... and "Toolchain probe" in helpers.py
+"""
+
+import concurrent.futures
+import os
+import os.path
+import subprocess
+import tempfile
+
+def probes_class():
+    int_data = _internal_data()
+
+    ext_methods = {
+        'probe_linkers' : lambda *args: probe_linkers(int_data, args[0], args[1], args[2], args[3]),
+        'probe_toolchain' : lambda *args: probe_toolchain(int_data, args[0], args[1], args[2])
+    }
+    return ext_methods
+
+# ========== ALL THE FUNCTIONS BELOW ARE NOT INTENDED TO BE IMPORTED ==========
+
+# ========== METHODS ==========
+
+# Internal method
+# Returns 1 if the command succeeds, or the message of the compiler
+def _run_probe(command, probe_dir):
+    try:
+        completed = subprocess.run(command, cwd = probe_dir, capture_output = True, text = True, \
+                                    timeout = _PROBE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as error:
+        return str(error)
+    if completed.returncode != 0:
+        # The first line tells what is wrong, like "cannot find 'ld.mold'"
+        return (completed.stderr.strip().splitlines() or ['exited with ' + str(completed.returncode)])[0]
+    return 1
+
+# Internal method
+# The object is compiled once and linked by every linker
+def _compile_probe_object(int_data, probe_dir, compile_command):
+    with open(os.path.join(probe_dir, 'probe.cpp'), 'w') as probe_source:
+        probe_source.write(int_data['probe_source'])
+    return _run_probe(compile_command + ['-c', 'probe.cpp', '-o', 'probe.o'], probe_dir)
+
+# External method
+# linkers is a list of names for -fuse-ld= ('' for the default linker of the compiler);
+# returns {linker : 1 or the reason why it doesn't work}
+def probe_linkers(int_data, cxx, cxx_flags, link_flags, linkers):
+    with tempfile.TemporaryDirectory(prefix = 'scons-probe-') as probe_dir:
+        compiled = _compile_probe_object(int_data, probe_dir, [cxx] + cxx_flags)
+        if compiled != 1:
+            return dict([(linker, 'the probe is not compiled: ' + compiled) for linker in linkers])
+        commands = {}
+        for linker in linkers:
+            use_linker = ['-fuse-ld=' + linker] if linker else []
+            commands[linker] = [cxx] + link_flags + use_linker + ['probe.o', '-o', 'probe-' + (linker or 'default')]
+        with concurrent.futures.ThreadPoolExecutor(max_workers = len(linkers)) as executor:
+            results = dict(zip(linkers, executor.map(lambda linker: _run_probe(commands[linker], probe_dir), \
+                                                        linkers)))
+    return results
+
+# Internal method
+# Returns the output of the command, or None if it fails
+def _get_probe_output(command, probe_dir):
+    try:
+        completed = subprocess.run(command, cwd = probe_dir, stdin = subprocess.DEVNULL, \
+                                    capture_output = True, text = True, timeout = _PROBE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if completed.returncode != 0:
+        return None
+    return completed.stdout
+
+# Internal method
+# Groups the flags with their separate arguments (like ['-include', 'config.h'])
+def _group_flags(int_data, flags):
+    groups = []
+    for flag in flags:
+        if groups and groups[-1][-1] in int_data['flags_with_argument'] and len(groups[-1]) == 1:
+            groups[-1].append(flag)
+        else:
+            groups.append([flag])
+    return groups
+
+# Internal method
+# The value of __cplusplus with the flags (that is, the language standard in effect), or 0
+def _parse_cplusplus(predefined):
+    for line in (predefined or '').splitlines():
+        if line.startswith('#define __cplusplus '):
+            return int(line.split()[2].rstrip('L'))
+    return 0
+
+# External method
+# cxx is the compiler command (a list, like ['ccache', 'g++']); the flags are lists too.
+# Returns a dictionary (it's saved to the toolchain cache as is):
+#   'version' : the first line of 'cxx --version',
+#   'cplusplus' : __cplusplus with cxx_flags,
+#   'standards' : the supported values of -std=,
+#   'rejected_compile_flags', 'rejected_link_flags' : {flag : why}
+# The flags are probed one by one only if they are rejected all together.
+def probe_toolchain(int_data, cxx, cxx_flags, link_flags):
+    with tempfile.TemporaryDirectory(prefix = 'scons-probe-') as probe_dir:
+        compiled = _compile_probe_object(int_data, probe_dir, cxx)
+        with concurrent.futures.ThreadPoolExecutor(max_workers = _PROBE_WORKERS) as executor:
+            version = executor.submit(_get_probe_output, cxx + ['--version'], probe_dir)
+            predefined = executor.submit(_get_probe_output, cxx + cxx_flags + ['-x', 'c++', '-E', '-dM', '-'], \
+                                            probe_dir)
+            standards = [(standard, executor.submit(_run_probe, \
+                                cxx + ['-std=' + standard, '-fsyntax-only', 'probe.cpp'], probe_dir)) \
+                                for standard in int_data['standards']]
+            compile_all = executor.submit(_run_probe, cxx + cxx_flags + ['-c', 'probe.cpp', '-o', 'probe-all.o'], \
+                                            probe_dir)
+            link_all = None
+            if compiled == 1:
+                link_all = executor.submit(_run_probe, cxx + link_flags + ['probe.o', '-o', 'probe-all'], probe_dir)
+            rejected_compile_flags = {}
+            if compile_all.result() != 1:
+                groups = _group_flags(int_data, cxx_flags)
+                results = list(executor.map(lambda numbered: _run_probe(cxx + numbered[1] + \
+                                ['-c', 'probe.cpp', '-o', 'probe-%d.o' % numbered[0]], probe_dir), enumerate(groups)))
+                for group, result in zip(groups, results):
+                    if result != 1:
+                        rejected_compile_flags[' '.join(group)] = result
+                if not rejected_compile_flags:
+                    rejected_compile_flags[' '.join(cxx_flags)] = compile_all.result()
+            rejected_link_flags = {}
+            if link_all is not None and link_all.result() != 1:
+                groups = _group_flags(int_data, link_flags)
+                results = list(executor.map(lambda numbered: _run_probe(cxx + numbered[1] + \
+                                ['probe.o', '-o', 'probe-%d' % numbered[0]], probe_dir), enumerate(groups)))
+                for group, result in zip(groups, results):
+                    if result != 1:
+                        rejected_link_flags[' '.join(group)] = result
+                if not rejected_link_flags:
+                    rejected_link_flags[' '.join(link_flags)] = link_all.result()
+            return {
+                'version' : ((version.result() or '').splitlines() or ['unknown'])[0],
+                'cplusplus' : _parse_cplusplus(predefined.result()),
+                'standards' : [standard for standard, result in standards if result.result() == 1],
+                'rejected_compile_flags' : rejected_compile_flags,
+                'rejected_link_flags' : rejected_link_flags
+            }
+
+# Seconds; a linker that hangs is as good as absent
+_PROBE_TIMEOUT = 60
+
+# The probes are small: most of the time they wait for the compiler to start
+_PROBE_WORKERS = 8
+
+# ========== (DATA) CONSTRUCTOR ==========
+
+def _internal_data():
+    mydata = {
+        # Uses the C++ library, so that linking it checks the flags with libstdc++ too
+        'probe_source' : '#include <string>\n\nint main(int argc, char *argv[])\n' + \
+                            '{\n    return std::string(argv[0]).size() > 0 && argc > 0 ? 0 : 1;\n}\n',
+        # See function probe_toolchain
+        'standards' : ['c++11', 'c++14', 'c++17', 'c++20', 'c++23'],
+        # Flags with a separate argument (see function _group_flags)
+        'flags_with_argument' : ['-include', '-imacros', '-isystem', '-idirafter', '-iquote', '-iprefix', \
+                                    '-I', '-D', '-U', '-L', '-l', '-x', '-Xlinker', '-Xassembler', \
+                                    '-Xpreprocessor', '-specs', '-T', '-u', '-z', '-MF', '-MT', '-MQ']
+    }
+    return mydata
@@ -1,7 +1,183 @@
+#include <algorithm>
+#include <condition_variable>
+#include <cstdlib>
+#include <cstring>
 #include <iostream>
+#include <memory>
+#include <mutex>
+#include <string>
+#include <thread>
+#include <vector>
 
-int main()
+namespace
 {
-    std::cout << "Hello World!" << std::endl;
-    return 0;
+    const std::string greeting = "Hello World!\n";
+
+    // The output is written in blocks of this size
+    const std::size_t block_size = 1 << 20;
+
+    void print_usage(const char *name)
+    {
+        std::cerr << "usage: " << name << " [--repeat N | --bytes N[K|M|G]] [--threads N]" << std::endl;
+    }
+
+    // A positive number, with an optional suffix K, M or G if with_suffix
+    bool parse_number(const char *text, bool with_suffix, unsigned long long &number)
+    {
+        char *end = nullptr;
+        number = std::strtoull(text, &end, 10);
+        if (end == text || number == 0)
+            return false;
+        if (with_suffix && *end != '\0' && *(end + 1) == '\0')
+        {
+            const std::string suffixes = "KMG";
+            const std::size_t power = suffixes.find(*end);
+            if (power == std::string::npos)
+                return false;
+            for (std::size_t i = 0; i <= power; ++i)
+                number *= 1024;
+            ++end;
+        }
+        return *end == '\0';
+    }
+
+    // Fills the buffer with the part of the output that starts at offset
+    void fill_block(char *buffer, std::size_t size, unsigned long long offset)
+    {
+        std::size_t phase = offset % greeting.size();
+        std::size_t filled = 0;
+        while (filled < size)
+        {
+            const std::size_t part = std::min(size - filled, greeting.size() - phase);
+            std::memcpy(buffer + filled, greeting.data() + phase, part);
+            filled += part;
+            phase = 0;
+        }
+    }
+
+    // Threads that fill their blocks every round, started once
+    class block_fillers
+    {
+    public:
+        block_fillers(std::vector<std::vector<char>> &blocks, std::vector<std::size_t> &sizes,
+                      std::vector<unsigned long long> &offsets)
+            : blocks(blocks), sizes(sizes), offsets(offsets)
+        {
+            for (std::size_t t = 0; t < blocks.size(); ++t)
+                workers.emplace_back(&block_fillers::work, this, t);
+        }
+
+        ~block_fillers()
+        {
+            {
+                std::lock_guard<std::mutex> lock(mutex);
+                stopped = true;
+            }
+            round_started.notify_all();
+            for (auto &worker : workers)
+                worker.join();
+        }
+
+        // Fills all the blocks (with the sizes and offsets set by the caller) and waits for them
+        void fill_round()
+        {
+            std::unique_lock<std::mutex> lock(mutex);
+            pending = workers.size();
+            ++round;
+            round_started.notify_all();
+            round_finished.wait(lock, [this] { return pending == 0; });
+        }
+
+    private:
+        void work(std::size_t t)
+        {
+            unsigned long long done_round = 0;
+            std::unique_lock<std::mutex> lock(mutex);
+            while (true)
+            {
+                round_started.wait(lock, [this, done_round] { return stopped || round != done_round; });
+                if (stopped)
+                    return;
+                done_round = round;
+                lock.unlock();
+                fill_block(blocks[t].data(), sizes[t], offsets[t]);
+                lock.lock();
+                if (--pending == 0)
+                    round_finished.notify_one();
+            }
+        }
+
+        std::vector<std::vector<char>> &blocks;
+        std::vector<std::size_t> &sizes;
+        std::vector<unsigned long long> &offsets;
+        std::vector<std::thread> workers;
+        std::mutex mutex;
+        std::condition_variable round_started;
+        std::condition_variable round_finished;
+        unsigned long long round = 0;
+        std::size_t pending = 0;
+        bool stopped = false;
+    };
+}
+
+int main(int argc, char *argv[])
+{
+    // Not synced with C stdio: std::cout writes its buffer directly
+    std::ios::sync_with_stdio(false);
+
+    unsigned long long total = greeting.size();
+    unsigned long long threads = 1;
+    for (int i = 1; i < argc; ++i)
+    {
+        const std::string option = argv[i];
+        unsigned long long number = 0;
+        if (i + 1 >= argc)
+        {
+            print_usage(argv[0]);
+            return 2;
+        }
+        if (option == "--repeat" && parse_number(argv[i + 1], false, number))
+            total = number * greeting.size();
+        else if (option == "--bytes" && parse_number(argv[i + 1], true, number))
+            total = number;
+        else if (option == "--threads" && parse_number(argv[i + 1], false, number) && number <= 256)
+            threads = number;
+        else
+        {
+            print_usage(argv[0]);
+            return 2;
+        }
+        ++i;
+    }
+
+    // Each round, each thread fills its own block, then the blocks are written in order;
+    // no more blocks (and threads) than the output needs, and no bigger than it
+    const std::size_t size = std::min<unsigned long long>(block_size, total);
+    threads = std::min(threads, (total + size - 1) / size);
+    std::vector<std::vector<char>> blocks(threads, std::vector<char>(size));
+    std::vector<std::size_t> sizes(threads);
+    std::vector<unsigned long long> offsets(threads);
+    std::unique_ptr<block_fillers> fillers;
+    if (threads > 1)
+        fillers.reset(new block_fillers(blocks, sizes, offsets));
+    unsigned long long written = 0;
+    while (written < total)
+    {
+        for (std::size_t t = 0; t < threads; ++t)
+        {
+            offsets[t] = written + t * size;
+            sizes[t] = offsets[t] < total ? std::min<unsigned long long>(size, total - offsets[t]) : 0;
+        }
+        if (fillers)
+            fillers->fill_round();
+        else
+            fill_block(blocks[0].data(), sizes[0], offsets[0]);
+        for (std::size_t t = 0; t < threads && sizes[t]; ++t)
+        {
+            std::cout.write(blocks[t].data(), sizes[t]);
+            written += sizes[t];
+        }
+    }
+    std::cout.flush();
+    return std::cout ? 0 : 1;
 }
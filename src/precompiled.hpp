@@ -0,0 +1,3 @@
+// Heavy standard headers that every source file includes;
+// this header is precompiled (see 'prefix_headers' in SConstruct)
+#include <iostream>
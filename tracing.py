@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Collects timings of the helper's phases and of the built nodes
+and writes them as a Chrome trace (JSON) file, that can be opened
+in chrome://tracing, https://ui.perfetto.dev or https://www.speedscope.app
+
+See TRACE=... in helpers.py
+"""
+
+import json
+import os
+import threading
+import time
+
+def tracing_class():
+    int_data = _internal_data()
+
+    ext_methods = {
+        'now' : lambda: now(int_data),
+        'add_event' : lambda *args: add_event(int_data, *args),
+        'trace' : lambda *args: trace(int_data, args[0], args[1], args[2]),
+        'write_trace' : lambda *args: write_trace(int_data, args[0])
+    }
+    return ext_methods
+
+# ========== ALL THE FUNCTIONS BELOW ARE NOT INTENDED TO BE IMPORTED ==========
+
+# ========== METHODS ==========
+
+# External method
+# Microseconds since the tracer was created
+def now(int_data):
+    return (time.perf_counter() - int_data['started']) * 1000000
+
+# Internal method
+# Chrome trace shows one row per thread; SCons builds nodes in several threads (-jN)
+def _get_tid(int_data):
+    ident = threading.get_ident()
+    with int_data['lock']:
+        if ident not in int_data['tids']:
+            int_data['tids'][ident] = len(int_data['tids']) + 1
+        return int_data['tids'][ident]
+
+# External method
+def add_event(int_data, name, category, started, args = None):
+    event = {
+        'name' : name,
+        'cat' : category,
+        'ph' : 'X',
+        'ts' : started,
+        'dur' : now(int_data) - started,
+        'pid' : int_data['pid'],
+        'tid' : _get_tid(int_data)
+    }
+    if args:
+        event['args'] = args
+    with int_data['lock']:
+        int_data['events'].append(event)
+
+# External method
+def trace(int_data, name, category, func):
+    started = now(int_data)
+    try:
+        return func()
+    finally:
+        add_event(int_data, name, category, started)
+
+# External method
+def write_trace(int_data, trace_file):
+    with int_data['lock']:
+        events = list(int_data['events'])
+    with open(trace_file, 'w') as opened_file:
+        json.dump({'traceEvents' : events, 'displayTimeUnit' : 'ms'}, opened_file)
+    print('trace with ' + str(len(events)) + ' events written to ' + trace_file)
+
+# ========== (DATA) CONSTRUCTOR ==========
+
+def _internal_data():
+    mydata = {
+        'started' : time.perf_counter(),
+        'pid' : os.getpid(),
+        # Thread identifier -> small number (see function _get_tid)
+        'tids' : {},
+        'events' : [],
+        'lock' : threading.Lock()
+    }
+    return mydata
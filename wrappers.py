@@ -1,23 +1,53 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 
+import atexit
+import json
+import os
+import os.path
+import shlex
+import shutil
+import stat
+import subprocess
+import sys
+import threading
+import time
+
+import SCons.Action
+import SCons.CacheDir
+import SCons.Scanner.C
+import SCons.Tool.install
 import SCons.Util
-from SCons.Script import Environment, Variables, ARGUMENTS, COMMAND_LINE_TARGETS
+from SCons.Script import Environment, DefaultEnvironment, ARGUMENTS, COMMAND_LINE_TARGETS, GetOption, SetOption
+
+from compile_broker import broker_client_class
 
-def wrappers_class(variables_cache_file):
-    int_data = _internal_data(variables_cache_file)
+def wrappers_class(tracer):
+    int_data = _internal_data(tracer)
+    return _ext_methods(int_data)
 
+def _ext_methods(int_data):
     ext_methods = {
         'get_argument_from_cli' : lambda *args: get_argument_from_cli(int_data, args[0]),
+        'get_arguments_from_cli' : lambda: get_arguments_from_cli(int_data),
         'get_option_from_cli' : lambda *args: get_option_from_cli(int_data, args[0]),
         'get_any_target_from_cli' : lambda: get_any_target_from_cli(int_data),
-        'get_var_from_env' : lambda *args: get_var_from_env(int_data, args[0]),
         'replace_var_in_env' : lambda *args: replace_var_in_env(int_data, args[0], args[1]),
-        'append_value_to_var_in_env' : lambda *args: append_value_to_var_in_env(int_data, args[0], args[1]),
-        'read_vars_from_cache' : lambda *args: read_vars_from_cache(int_data, args[0]),
-        'save_vars_to_cache' : lambda *args: save_vars_to_cache(int_data, args[0], args[1], variables_cache_file),
-        'will_compile' : lambda *args: will_compile(int_data, args[0], args[1]),
-        'will_install' : lambda *args: will_install(int_data, args[0], args[1])
+        'will_compile' : lambda *args: will_compile(int_data, args[0], args[1], args[2], args[3], args[4]),
+        'will_train' : lambda *args: will_train(int_data, args[0], args[1], args[2]),
+        'will_measure_throughput' : lambda *args: will_measure_throughput(int_data, args[0], args[1], args[2]),
+        'will_measure_startup' : lambda *args: will_measure_startup(int_data, args[0], args[1], args[2], args[3]),
+        'will_install' : lambda *args: will_install(int_data, args[0], args[1]),
+        'will_install_files' : lambda *args: will_install_files(int_data, args[0]),
+        'will_pack_split_dwarf' : lambda *args: will_pack_split_dwarf(int_data, args[0], args[1]),
+        'will_install_split_debug' : lambda *args: will_install_split_debug(int_data, args[0], args[1], \
+                                                                            args[2], args[3], args[4]),
+        'set_install_mode' : lambda *args: set_install_mode(int_data, args[0], args[1]),
+        'use_cache_dir' : lambda *args: use_cache_dir(int_data, args[0], args[1]),
+        'set_incremental_mode' : lambda *args: set_incremental_mode(int_data, args[0]),
+        'set_num_jobs' : lambda *args: set_num_jobs(int_data, args[0]),
+        'measure_compile_memory' : lambda *args: measure_compile_memory(int_data, args[0], args[1]),
+        'new_matrix_wrappers' : lambda *args: new_matrix_wrappers(int_data, args[0])
     }
     return ext_methods
 
@@ -30,9 +60,151 @@ def get_argument_from_cli(int_data, argname):
     myvalue = int_data['arguments'].get(argname)
     return myvalue
 
+# External method
+def get_arguments_from_cli(int_data):
+    return int_data['arguments']
+
+# Internal method
+# The Environment is constructed on the first use only, and only once per run
+# (for example, cleaning doesn't need it at all)
+def _get_env(int_data):
+    if int_data['env'] is None and int_data['base'] is not None:
+        # An isolated copy of the base Environment (see function new_matrix_wrappers)
+        int_data['env'] = _get_env(int_data['base']).Clone()
+    if int_data['env'] is None:
+        # SCons falls back to the default Environment (for example, to find CacheDir);
+        # without this it is constructed lazily, with all the tools, in the build threads,
+        # and loading the tools there concurrently fails (seen with INCREMENTAL=1 and -jN)
+        DefaultEnvironment(tools = [])
+        tools = int_data['env_tools']
+        tools_passed = get_argument_from_cli(int_data, 'ENV_TOOLS')
+        if tools_passed:
+            tools = tools_passed.split(',')
+        started = time.perf_counter()
+        int_data['env'] = int_data['tracer']['trace']('Environment', 'phase', \
+                                                        lambda: Environment(tools = tools))
+        print('constructed SCons Environment with tools ' + ', '.join(tools) + \
+                        ' in ' + '%.3f' % (time.perf_counter() - started) + ' s')
+        int_data['env']['INSTALL'] = lambda dest, source, install_env: \
+                                            _install_file(int_data, dest, source, install_env)
+        if int_data['compile_memory'] is not None:
+            _measure_spawn(int_data, int_data['env'])
+        broker_socket = get_argument_from_cli(int_data, 'COMPILE_BROKER')
+        if broker_socket:
+            _use_compile_broker(int_data, int_data['env'], broker_socket)
+        _trace_builds(int_data, int_data['env'])
+        if get_argument_from_cli(int_data, 'LINKER'):
+            _time_links(int_data, int_data['env'])
+    return int_data['env']
+
+# Internal method
+# Makes every external command (compiling, linking) and every installing
+# recorded by the tracer; the Environments cloned from this one inherit it
+def _trace_builds(int_data, env):
+    # SPAWN gets only the command line; the target of the command is remembered
+    # (in the thread that runs it) when SCons prepares the execution environment for it
+    env['SHELL_ENV_GENERATORS'] = list(env.get('SHELL_ENV_GENERATORS') or []) + \
+                        [lambda gen_env, target, source, shell_env: _remember_target(int_data, target, shell_env)]
+    spawn = env['SPAWN']
+    env['SPAWN'] = lambda sh, escape, cmd, args, spawn_env: \
+                        _traced_spawn(int_data, spawn, sh, escape, cmd, args, spawn_env)
+    install = env.get('INSTALL')
+    if install:
+        env['INSTALL'] = lambda dest, source, install_env: int_data['tracer']['trace']( \
+                                'install ' + dest, 'build', lambda: install(dest, source, install_env))
+
+# Internal method
+def _remember_target(int_data, target, shell_env):
+    int_data['spawn_target'].node = target[0] if target else None
+    return shell_env
+
+# Internal method
+def _traced_spawn(int_data, spawn, sh, escape, cmd, args, spawn_env):
+    started = int_data['tracer']['now']()
+    target = getattr(int_data['spawn_target'], 'node', None)
+    int_data['spawn_target'].node = None
+    try:
+        return spawn(sh, escape, cmd, args, spawn_env)
+    finally:
+        # The name of the event is the path of the target node (not the escaped
+        # command line), or the program run if there's no target
+        name = target.path if target is not None else args[0]
+        int_data['tracer']['add_event'](name, 'build', started, {'command' : ' '.join(args)})
+
+# Internal method
+# Prints the wall time of each link (a command with '-o' and without '-c')
+def _time_links(int_data, env):
+    spawn = env['SPAWN']
+    env['SPAWN'] = lambda sh, escape, cmd, args, spawn_env: \
+                        _timed_link_spawn(int_data, spawn, sh, escape, cmd, args, spawn_env)
+
+# Internal method
+def _timed_link_spawn(int_data, spawn, sh, escape, cmd, args, spawn_env):
+    if '-c' in args or '-o' not in args[:-1]:
+        return spawn(sh, escape, cmd, args, spawn_env)
+    started = time.perf_counter()
+    returncode = spawn(sh, escape, cmd, args, spawn_env)
+    # (the arguments are escaped for sh)
+    unescaped_args = shlex.split(' '.join(args))
+    linker = 'default linker'
+    for arg in unescaped_args:
+        if arg.startswith('-fuse-ld='):
+            linker = arg[len('-fuse-ld='):]
+    print('link time: ' + unescaped_args[unescaped_args.index('-o') + 1] + \
+                    ' in %.3f s (%s)' % (time.perf_counter() - started, linker))
+    return returncode
+
+# Internal method
+# Compile commands are run by this script itself, to get the resources they used
+# (the compilations sent to the compile broker are not measured)
+def _measure_spawn(int_data, env):
+    spawn = env['SPAWN']
+    env['SPAWN'] = lambda sh, escape, cmd, args, spawn_env: \
+                        _measured_spawn(int_data, spawn, sh, escape, cmd, args, spawn_env)
+
+# Internal method
+# The same as SCons does on POSIX (sh -c), but with os.wait4
+def _measured_spawn(int_data, spawn, sh, escape, cmd, args, spawn_env):
+    if not ('-c' in args and '-o' in args[:-1]):
+        return spawn(sh, escape, cmd, args, spawn_env)
+    process = subprocess.Popen([sh, '-c', ' '.join(args)], env = spawn_env, close_fds = True)
+    pid, status, rusage = os.wait4(process.pid, 0)
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    if process.returncode == 0:
+        # ru_maxrss (KiB) covers the compiler processes started by the driver too
+        # (the arguments are escaped for sh)
+        unescaped_args = shlex.split(' '.join(args))
+        int_data['compile_memory'][unescaped_args[unescaped_args.index('-o') + 1]] = rusage.ru_maxrss
+    return process.returncode
+
+# Internal method
+# Compile commands are sent to the compile broker (see compile_broker.py)
+def _use_compile_broker(int_data, env, broker_socket):
+    int_data['broker'] = broker_client_class(broker_socket)
+    spawn = env['SPAWN']
+    env['SPAWN'] = lambda sh, escape, cmd, args, spawn_env: \
+                        _brokered_spawn(int_data, spawn, sh, escape, cmd, args, spawn_env)
+    print('compile broker: ' + broker_socket)
+
+# Internal method
+def _brokered_spawn(int_data, spawn, sh, escape, cmd, args, spawn_env):
+    if '-c' in args and '-o' in args[:-1]:
+        response = int_data['broker']['compile'](args, os.getcwd(), dict(spawn_env))
+        if response is not None:
+            sys.stdout.write(response['stdout'])
+            sys.stderr.write(response['stderr'])
+            return response['returncode']
+        if not int_data['broker_absent']:
+            int_data['broker_absent'] = 1
+            print('compile broker is not running, compiling directly')
+    return spawn(sh, escape, cmd, args, spawn_env)
+
 # External method
 def get_option_from_cli(int_data, optname):
-    myvalue = int_data['env'].GetOption(optname)
+    myvalue = GetOption(optname)
     return myvalue
 
 # External method
@@ -42,74 +214,573 @@ def get_any_target_from_cli(int_data):
     else:
         return 0
 
-# External method
-def get_var_from_env(int_data, varname):
-    mylist = int_data['env'][varname]
-    if mylist:
-        myvalue = int_data['env'][varname][0]
-    else:
-        myvalue = ''
-    return myvalue
-
 # External method
 def replace_var_in_env(int_data, key, value):
     replace_args = {}
     replace_args[key] = int_data['clvar'](value)
-    int_data['env'].Replace(**replace_args)
+    _get_env(int_data).Replace(**replace_args)
+
+# External method
+# compile_units is a list of (object, source) pairs; each pair becomes its own
+# object node, so that they can be built in parallel (scons -jN);
+# precompiled_headers is a list of (precompiled header, header) pairs;
+# extra_flags (like {'CXXFLAGS' : [...]}) are appended to the flags of the Environment,
+# and the objects depend on extra_depends as well
+def will_compile(int_data, compile_units, compile_target, precompiled_headers, extra_flags, extra_depends):
+    overrides = {}
+    for flags_name, flags in extra_flags.items():
+        overrides[flags_name] = SCons.Util.CLVar(_get_env(int_data).get(flags_name, [])) + flags
+    precompiled, headers, include_flags = _will_precompile_headers(int_data, precompiled_headers, overrides)
+    objects = []
+    for compile_object, compile_source in compile_units:
+        # An object can be already declared by another Environment with the same
+        # compile flags (see function new_matrix_wrappers); then it's shared
+        if compile_object not in int_data['declared_objects']:
+            if precompiled:
+                int_data['declared_objects'][compile_object] = _get_env(int_data).Object( \
+                        target = compile_object, source = compile_source, \
+                        CPPFLAGS = SCons.Util.CLVar(_get_env(int_data).get('CPPFLAGS', [])) + include_flags, \
+                        **overrides)
+                # '-include' is not seen by the scanner of #include; the objects depend on the headers,
+                # not on their precompiled versions, which are not the same even for the same
+                # header and flags (so a rebuilt one would make every object miss BUILD_CACHE)
+                _get_env(int_data).Depends(int_data['declared_objects'][compile_object], headers)
+                _get_env(int_data).Requires(int_data['declared_objects'][compile_object], precompiled)
+            else:
+                int_data['declared_objects'][compile_object] = _get_env(int_data).Object( \
+                        target = compile_object, source = compile_source, **overrides)
+            if extra_depends:
+                _get_env(int_data).Depends(int_data['declared_objects'][compile_object], extra_depends)
+        objects += int_data['declared_objects'][compile_object]
+    target_for_default = _get_env(int_data).Program(target = compile_target, source = objects, **overrides)
+    _get_env(int_data).Default(target_for_default)
+    print('will compile: target = ' + compile_target + ', sources = ' + \
+                    ' '.join([compile_source for compile_object, compile_source in compile_units]))
+    return _get_produced_files(precompiled + objects + target_for_default)
+
+# Internal method
+# Returns the nodes of the precompiled headers, the nodes of the headers (with what they #include)
+# and the flags that make the compiler use them: for '-include header.hpp' GCC looks through
+# the '-iquote' directories, and in each of them takes header.hpp.gch if it's valid,
+# then header.hpp; so the directory of the precompiled headers goes first
+def _will_precompile_headers(int_data, precompiled_headers, overrides):
+    precompiled = []
+    headers = []
+    quote_dirs = []
+    include_flags = []
+    scanner = SCons.Scanner.C.CScanner()
+    for precompiled_header, header in precompiled_headers:
+        if precompiled_header not in int_data['declared_objects']:
+            int_data['declared_objects'][precompiled_header] = _get_env(int_data).Command( \
+                    target = precompiled_header, source = header, action = int_data['pch_command'], \
+                    source_scanner = scanner, **overrides)
+            # A precompiled header is tens of MB: in BUILD_CACHE it would push out most of the objects
+            _get_env(int_data).NoCache(int_data['declared_objects'][precompiled_header])
+        precompiled += int_data['declared_objects'][precompiled_header]
+        header_node = _get_env(int_data).File(header)
+        headers += [header_node] + header_node.get_implicit_deps(_get_env(int_data), scanner, \
+                        lambda path_scanner: path_scanner.path(_get_env(int_data)))
+        for quote_dir in [os.path.dirname(precompiled_header), os.path.dirname(header) or '.']:
+            if quote_dir not in quote_dirs:
+                quote_dirs.append(quote_dir)
+        include_flags += ['-include', os.path.basename(header)]
+    if include_flags:
+        include_flags = [flag for quote_dir in quote_dirs for flag in ['-iquote', quote_dir]] + \
+                            include_flags + ['-Winvalid-pch']
+    return precompiled, headers, include_flags
+
+# External method
+def will_install(int_data, install_source, install_target):
+    target_for_default = _get_env(int_data).Install(dir = install_target, source = install_source)
+    # Installed files are copies of what is already cached (or of what is not worth caching)
+    _get_env(int_data).NoCache(target_for_default)
+    _get_env(int_data).Default(target_for_default)
+    print('will install: dir = ' + install_target + ', source = ' + install_source)
+    return _get_produced_files(target_for_default)
+
+# External method
+# profiles is a list of (profile written by instrumented_target, profile read by the optimized build) pairs;
+# the training run is repeated only when instrumented_target or training_arguments change
+def will_train(int_data, instrumented_target, training_arguments, profiles):
+    target_for_profile = _get_env(int_data).Command( \
+            target = [optimized_profile for instrumented_profile, optimized_profile in profiles], \
+            source = [instrumented_target, _get_env(int_data).Value(training_arguments)], \
+            action = SCons.Action.Action(_run_training, 'training run: $SOURCE ' + ' '.join(training_arguments)), \
+            TRAINING_ARGUMENTS = training_arguments, PROFILES = profiles)
+    print('will train: ' + instrumented_target + ' ' + ' '.join(training_arguments))
+    return _get_produced_files(target_for_profile)
+
+# Internal method, is used as the action of the training run (see function will_train)
+def _run_training(target, source, env):
+    # An instrumented binary adds its counters to the existing profile
+    for instrumented_profile, optimized_profile in env['PROFILES']:
+        if os.path.exists(instrumented_profile):
+            os.unlink(instrumented_profile)
+    command = [os.path.abspath(str(source[0]))] + env['TRAINING_ARGUMENTS']
+    with open(os.devnull, 'w') as devnull:
+        returncode = subprocess.call(command, stdout = devnull)
+    if returncode != 0:
+        print('_run_training ERROR: ' + ' '.join(command) + ' exited with ' + str(returncode))
+        return 1
+    for instrumented_profile, optimized_profile in env['PROFILES']:
+        if not os.path.isfile(instrumented_profile):
+            print('_run_training ERROR: ' + instrumented_profile + ' is not written by the training run')
+            return 1
+        os.makedirs(os.path.dirname(optimized_profile), exist_ok = True)
+        shutil.copyfile(instrumented_profile, optimized_profile)
+    return 0
 
 # External method
-def append_value_to_var_in_env(int_data, key, value):
-    int_data['env'][key] = int_data['clvar'](value)
-    # print('append_value_to_var_in_env after appending: ' + key + ' = ' + int_data['env'][key])
+# The binary is run every time (even if it's up to date), with its output read through a pipe
+def will_measure_throughput(int_data, benchmark_target, benchmark_arguments, result_file):
+    target_for_result = _get_env(int_data).Command(target = result_file, \
+            source = [benchmark_target, _get_env(int_data).Value(benchmark_arguments)], \
+            action = SCons.Action.Action(_measure_throughput, \
+                            'throughput benchmark: $SOURCE ' + ' '.join(benchmark_arguments)), \
+            BENCHMARK_ARGUMENTS = benchmark_arguments)
+    _get_env(int_data).AlwaysBuild(target_for_result)
+    _get_env(int_data).NoCache(target_for_result)
+    _get_env(int_data).SideEffect(int_data['benchmark_side_effect'], target_for_result)
+    _get_env(int_data).Default(target_for_result)
+    print('will measure throughput: ' + benchmark_target + ' ' + ' '.join(benchmark_arguments))
+    return _get_produced_files(target_for_result)
+
+# Internal method, is used as the action of the throughput benchmark (see function will_measure_throughput)
+def _measure_throughput(target, source, env):
+    command = [os.path.abspath(str(source[0]))] + env['BENCHMARK_ARGUMENTS']
+    output_bytes = 0
+    started = time.perf_counter()
+    with subprocess.Popen(command, stdout = subprocess.PIPE, bufsize = 0) as process:
+        buffer = bytearray(1 << 20)
+        read_bytes = process.stdout.readinto(buffer)
+        while read_bytes:
+            output_bytes += read_bytes
+            read_bytes = process.stdout.readinto(buffer)
+    seconds = time.perf_counter() - started
+    if process.returncode != 0:
+        print('_measure_throughput ERROR: ' + ' '.join(command) + ' exited with ' + str(process.returncode))
+        return 1
+    result = {
+        'arguments' : env['BENCHMARK_ARGUMENTS'],
+        'bytes' : output_bytes,
+        'seconds' : round(seconds, 4),
+        'mb_per_s' : round(output_bytes / seconds / 1000000, 1)
+    }
+    print('throughput: %d bytes in %.3f s, %.1f MB/s' % (output_bytes, seconds, result['mb_per_s']))
+    with open(str(target[0]), 'w') as result_file:
+        json.dump(result, result_file, indent = 1)
+    return 0
 
 # External method
-def read_vars_from_cache(int_data, descriptions):
-    for varname, is_saved_to_cache_file in descriptions.items():
-        print('Reading ' + varname + ' from cache as ' + is_saved_to_cache_file[0] + '...')
-        int_data['scons_var_obj'].Add(is_saved_to_cache_file)
-    # This adds new variables to Environment (doesn't rewrite it)
-    # https://scons.org/doc/2.3.0/HTML/scons-user/x2445.html#AEN2504
-    int_data['env'] = int_data['new_env_call'](variables = int_data['scons_var_obj'])
+# The binary is run every time (even if it's up to date); the results are kept
+# in result_file by label (the link profile), so result_file is not removed before
+def will_measure_startup(int_data, benchmark_target, runs, result_file, label):
+    target_for_result = _get_env(int_data).Command(target = result_file, \
+            source = [benchmark_target, _get_env(int_data).Value(runs)], \
+            action = SCons.Action.Action(_measure_startup, \
+                            'startup benchmark: $SOURCE, ' + str(runs) + ' runs'), \
+            BENCHMARK_RUNS = runs, BENCHMARK_LABEL = label)
+    _get_env(int_data).AlwaysBuild(target_for_result)
+    _get_env(int_data).Precious(target_for_result)
+    _get_env(int_data).NoCache(target_for_result)
+    _get_env(int_data).SideEffect(int_data['benchmark_side_effect'], target_for_result)
+    _get_env(int_data).Default(target_for_result)
+    print('will measure startup: ' + benchmark_target + ' (' + label + ')')
+    return _get_produced_files(target_for_result)
+
+# Internal method, is used as the action of the startup benchmark (see function will_measure_startup)
+def _measure_startup(target, source, env):
+    command = [os.path.abspath(str(source[0]))]
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    latencies = []
+    try:
+        # The first runs only bring the binary and its libraries into the page cache
+        for run in range(_STARTUP_WARMUP_RUNS + env['BENCHMARK_RUNS']):
+            started = time.perf_counter()
+            pid = os.posix_spawn(command[0], command, os.environ, file_actions = [(os.POSIX_SPAWN_DUP2, devnull, 1)])
+            status = os.waitpid(pid, 0)[1]
+            if run >= _STARTUP_WARMUP_RUNS:
+                latencies.append(time.perf_counter() - started)
+            if status != 0:
+                print('_measure_startup ERROR: ' + command[0] + ' exited with status ' + str(status))
+                return 1
+    finally:
+        os.close(devnull)
+    latencies.sort()
+    result = {
+        'runs' : len(latencies),
+        'mean_us' : round(sum(latencies) / len(latencies) * 1000000, 1),
+        'p50_us' : round(latencies[len(latencies) // 2] * 1000000, 1),
+        'p95_us' : round(latencies[min(len(latencies) - 1, len(latencies) * 95 // 100)] * 1000000, 1)
+    }
+    results = {}
+    if os.path.isfile(str(target[0])):
+        try:
+            with open(str(target[0])) as result_file:
+                results = json.load(result_file)
+        except ValueError:
+            results = {}
+    results[env['BENCHMARK_LABEL']] = result
+    for label in sorted(results):
+        print('startup (%s%s): mean %.1f us, p50 %.1f us, p95 %.1f us, %d runs' % (label, \
+                        ', this run' if label == env['BENCHMARK_LABEL'] else '', results[label]['mean_us'], \
+                        results[label]['p50_us'], results[label]['p95_us'], results[label]['runs']))
+    with open(str(target[0]), 'w') as result_file:
+        json.dump(results, result_file, indent = 1, sort_keys = True)
+    return 0
 
 # External method
-def save_vars_to_cache(int_data, descriptions, values, variables_cache_file):
-    for varname, is_saved_to_cache_file in descriptions.items():
-        print('Saving ' + varname + ' to cache as ' + is_saved_to_cache_file[0] + '...')
-        value = values[varname]
-        append_value_to_var_in_env(int_data, is_saved_to_cache_file[0], value)
-    # This saves only variables from 'scons_var_obj', not all variables from 'env'
-    # (here 'env' is the environment to get the option values from)
-    # https://scons.org/doc/3.0.1/HTML/scons-api/SCons.Variables.Variables-class.html#Save
-    # print('save_vars_to_cache: scons_var_obj HelpText:')
-    # print(int_data['scons_var_obj'].GenerateHelpText(int_data['env']))
-    int_data['scons_var_obj'].Save(variables_cache_file, int_data['env'])
+# install_pairs is a list of (source file, installed file) pairs
+def will_install_files(int_data, install_pairs):
+    targets_for_default = _get_env(int_data).InstallAs( \
+            target = [install_target for install_source, install_target in install_pairs], \
+            source = [install_source for install_source, install_target in install_pairs])
+    _get_env(int_data).NoCache(targets_for_default)
+    _get_env(int_data).Default(targets_for_default)
+    print('will install: ' + str(len(install_pairs)) + ' files')
+    return _get_produced_files(targets_for_default)
 
 # External method
-def will_compile(int_data, compile_source, compile_target):
-    target_for_default = int_data['env'].Program(target = compile_target, source = compile_source)
-    int_data['env'].Default(target_for_default)
-    print('will compile: target = ' + compile_target + ', source = ' + compile_source)
+# One node per binary: installs it stripped into installed_binary and writes its debug info
+# to debug_file; the files whose names are known only after that (the link by build ID,
+# the package of .dwo files) are passed to record_produced
+def will_install_split_debug(int_data, install_source, installed_binary, debug_file, build_id_dir, \
+                                record_produced):
+    targets_for_default = _get_env(int_data).Command(target = [installed_binary, debug_file], \
+            source = install_source, \
+            action = SCons.Action.Action(_install_split_debug, 'split debug: $SOURCE -> $TARGETS'), \
+            BUILD_ID_DIR = build_id_dir, RECORD_PRODUCED = record_produced, \
+            SPLIT_DEBUG_TOOLS = int_data['split_debug_tools'])
+    _get_env(int_data).NoCache(targets_for_default)
+    _get_env(int_data).Default(targets_for_default)
+    print('will install with split debug: ' + installed_binary + ', ' + debug_file)
+    return _get_produced_files(targets_for_default)
+
+# Internal method, is used as the action of will_install_split_debug
+def _install_split_debug(target, source, env):
+    tools = env['SPLIT_DEBUG_TOOLS']
+    binary = str(source[0])
+    installed_binary = str(target[0])
+    debug_file = str(target[1])
+    for produced_file in [installed_binary, debug_file]:
+        os.makedirs(os.path.dirname(produced_file), exist_ok = True)
+    # Never write into an existing file: it can be a hard link to the build tree
+    if os.path.lexists(installed_binary):
+        os.unlink(installed_binary)
+    commands = [
+        [tools['objcopy'], '--only-keep-debug', binary, debug_file],
+        [tools['objcopy'], '--strip-debug', '--strip-unneeded', \
+                '--add-gnu-debuglink=' + debug_file, binary, installed_binary]
+    ]
+    produced_files = []
+    if _has_split_dwarf(tools['readelf'], binary):
+        dwp_file = os.path.splitext(debug_file)[0] + '.dwp'
+        commands.append([tools['dwp'], '-e', binary, '-o', dwp_file])
+        produced_files.append(dwp_file)
+    for command in commands:
+        completed = subprocess.run(command, capture_output = True, text = True)
+        if completed.returncode != 0:
+            print('_install_split_debug ERROR: ' + ' '.join(command) + ' exited with ' + \
+                            str(completed.returncode) + '\n' + completed.stderr)
+            return 1
+    build_id = _get_build_id(tools['readelf'], binary)
+    if build_id:
+        build_id_link = os.path.join(env['BUILD_ID_DIR'], build_id[:2], build_id[2:] + '.debug')
+        os.makedirs(os.path.dirname(build_id_link), exist_ok = True)
+        if os.path.lexists(build_id_link):
+            os.unlink(build_id_link)
+        os.symlink(os.path.relpath(debug_file, os.path.dirname(build_id_link)), build_id_link)
+        produced_files.append(build_id_link)
+    else:
+        print('_install_split_debug WARNING: ' + binary + ' has no build ID')
+    env['RECORD_PRODUCED'](produced_files)
+    return 0
 
 # External method
-def will_install(int_data, install_source, install_target):
-    target_for_default = int_data['env'].Install(dir = install_target, source = install_source)
-    int_data['env'].Default(target_for_default)
-    print('will install: dir = ' + install_target + ', source = ' + install_source)
+# Only the .dwo files of the binary are packed (into dwp_file), the binary is installed as is
+def will_pack_split_dwarf(int_data, install_source, dwp_file):
+    target_for_default = _get_env(int_data).Command(target = dwp_file, source = install_source, \
+            action = SCons.Action.Action(_pack_split_dwarf, 'split dwarf: $SOURCE -> $TARGET'), \
+            SPLIT_DEBUG_TOOLS = int_data['split_debug_tools'])
+    _get_env(int_data).NoCache(target_for_default)
+    _get_env(int_data).Default(target_for_default)
+    print('will pack split dwarf: ' + dwp_file)
+    return _get_produced_files(target_for_default)
+
+# Internal method, is used as the action of will_pack_split_dwarf
+def _pack_split_dwarf(target, source, env):
+    tools = env['SPLIT_DEBUG_TOOLS']
+    binary = str(source[0])
+    if not _has_split_dwarf(tools['readelf'], binary):
+        print('_pack_split_dwarf ERROR: ' + binary + ' has no split debug info ' + \
+                        '(SPLIT_DEBUG=1 is to be passed to the COMPILE run too)')
+        return 1
+    os.makedirs(os.path.dirname(str(target[0])), exist_ok = True)
+    command = [tools['dwp'], '-e', binary, '-o', str(target[0])]
+    completed = subprocess.run(command, capture_output = True, text = True)
+    if completed.returncode != 0:
+        print('_pack_split_dwarf ERROR: ' + ' '.join(command) + ' exited with ' + \
+                        str(completed.returncode) + '\n' + completed.stderr)
+        return 1
+    return 0
+
+# Internal method
+# Whether the first compile units of the binary are skeletons (with the name of
+# a .dwo file); dwp crashes on binaries without them
+def _has_split_dwarf(readelf, binary):
+    units = 0
+    with subprocess.Popen([readelf, '--debug-dump=info', binary], stdout = subprocess.PIPE, \
+                            stderr = subprocess.DEVNULL, text = True) as process:
+        for line in process.stdout:
+            if 'dwo_name' in line:
+                units = -1
+                break
+            if 'Compilation Unit @' in line:
+                units += 1
+                if units > _SKELETON_UNITS_CHECKED:
+                    break
+        process.kill()
+    return units == -1
+
+# Internal method
+def _get_build_id(readelf, binary):
+    completed = subprocess.run([readelf, '--notes', binary], capture_output = True, text = True)
+    for line in completed.stdout.splitlines():
+        if 'Build ID:' in line:
+            return line.split('Build ID:')[1].strip()
+    return ''
+
+# Internal method
+# Paths of the nodes, relative to the top directory when they are inside it
+def _get_produced_files(nodes):
+    return [str(node) for node in nodes]
+
+# External method
+def set_incremental_mode(int_data, rescan):
+    # The same as --implicit-cache (and --implicit-deps-changed) command-line options
+    SetOption('implicit_cache', 1)
+    if rescan:
+        SetOption('implicit_deps_changed', 1)
+    _get_env(int_data).Decider('content-timestamp')
+    print('incremental mode: implicit dependencies are cached, ' + \
+                    'files are hashed only when their timestamps change')
+
+# External method
+def set_install_mode(int_data, install_mode, allow_hardlink):
+    int_data['install_mode'] = install_mode
+    int_data['allow_hardlink'] = allow_hardlink
+    print('install mode: ' + install_mode + ', hard links are ' + \
+                    ('allowed' if allow_hardlink else 'not allowed'))
+
+# Internal method, is used as INSTALL construction variable
+# (see function copyFunc in SCons/Tool/install.py)
+def _install_file(int_data, dest, source, install_env):
+    if int_data['install_mode'] == 'copy' or os.path.isdir(source) or \
+                os.stat(source).st_dev != os.stat(os.path.dirname(dest)).st_dev:
+        return SCons.Tool.install.copyFunc(dest, source, install_env)
+    # Never write into an existing file: it can be a hard link to the build tree
+    if os.path.lexists(dest):
+        os.unlink(dest)
+    if _reflink_file(dest, source):
+        print('installed by reflink: ' + dest)
+        return 0
+    if int_data['allow_hardlink']:
+        try:
+            os.link(source, dest)
+            print('installed by hard link: ' + dest)
+            return 0
+        except OSError:
+            pass
+    return SCons.Tool.install.copyFunc(dest, source, install_env)
+
+# Internal method
+# A copy-on-write clone (Linux FICLONE ioctl: btrfs, XFS, ...); returns 0 if not supported
+def _reflink_file(dest, source):
+    if not sys.platform.startswith('linux'):
+        return 0
+    import fcntl
+    try:
+        with open(source, 'rb') as source_file, open(dest, 'wb') as dest_file:
+            fcntl.ioctl(dest_file.fileno(), _FICLONE, source_file.fileno())
+    except OSError:
+        if os.path.lexists(dest):
+            os.unlink(dest)
+        return 0
+    # The same as copyFunc does after copying
+    shutil.copystat(source, dest)
+    st = os.stat(source)
+    os.chmod(dest, stat.S_IMODE(st.st_mode) | stat.S_IWRITE)
+    return 1
+
+# External method
+# The cache is keyed by SCons build signatures, that is by the full command lines
+# (CXX, CXXFLAGS, LINKFLAGS) plus the content of the sources
+def use_cache_dir(int_data, cache_dir, size_limit):
+    _get_env(int_data).CacheDir(cache_dir, _BuildCacheDir)
+    _get_env(int_data).get_CacheDir().tracer = int_data['tracer']
+    print('will use build cache: ' + cache_dir + ', size limit: ' + str(size_limit) + ' bytes')
+    atexit.register(lambda: _finish_cache_dir(int_data, cache_dir, size_limit))
+
+# Internal method
+def _finish_cache_dir(int_data, cache_dir, size_limit):
+    cache = _get_env(int_data).get_CacheDir()
+    cached_bytes, pruned_bytes = _prune_cache_dir(cache_dir, size_limit)
+    print('build cache: ' + str(cache.requests) + ' requests, ' + \
+                    str(cache.hits) + ' hits, ' + str(cache.misses) + ' misses, ' + \
+                    str(cache.bytes_retrieved) + ' bytes retrieved, ' + \
+                    str(cache.bytes_pushed) + ' bytes pushed, ' + \
+                    str(pruned_bytes) + ' bytes pruned, ' + \
+                    str(cached_bytes) + ' bytes in cache')
+
+# Internal method
+# Removes least recently used files until the cache fits into size_limit;
+# SCons touches a cache file every time it is retrieved, so mtime is the time of last use
+def _prune_cache_dir(cache_dir, size_limit):
+    cached_files = []
+    cached_bytes = 0
+    for dirpath, dirnames, filenames in os.walk(cache_dir):
+        for filename in filenames:
+            # 'config' is the file where SCons keeps the cache layout
+            if dirpath == cache_dir and filename == 'config':
+                continue
+            cached_file = os.path.join(dirpath, filename)
+            try:
+                stat_result = os.stat(cached_file)
+            except OSError:
+                # Pruned by a concurrent run
+                continue
+            cached_files.append((stat_result.st_mtime, stat_result.st_size, cached_file))
+            cached_bytes += stat_result.st_size
+    pruned_bytes = 0
+    for mtime, size, cached_file in sorted(cached_files):
+        if cached_bytes <= size_limit:
+            break
+        try:
+            os.unlink(cached_file)
+        except OSError:
+            continue
+        cached_bytes -= size
+        pruned_bytes += size
+    return cached_bytes, pruned_bytes
+
+# Counts the bytes that go through the cache (for the summary printed at exit)
+# and records the retrievals by the tracer
+class _BuildCacheDir(SCons.CacheDir.CacheDir):
+    def __init__(self, path):
+        super().__init__(path)
+        self.bytes_retrieved = 0
+        self.bytes_pushed = 0
+        # Set in function use_cache_dir
+        self.tracer = None
+
+    def retrieve(self, node):
+        if self.tracer is None:
+            return super().retrieve(node)
+        started = self.tracer['now']()
+        retrieved = super().retrieve(node)
+        if retrieved:
+            self.tracer['add_event']('cache hit ' + str(node), 'cache', started)
+        else:
+            self.tracer['add_event']('cache miss ' + str(node), 'cache', started)
+        return retrieved
+
+    def copy_from_cache(self, env, src, dst):
+        result = super().copy_from_cache(env, src, dst)
+        self.bytes_retrieved += os.path.getsize(dst)
+        return result
+
+    def copy_to_cache(self, env, src, dst):
+        result = super().copy_to_cache(env, src, dst)
+        self.bytes_pushed += os.path.getsize(dst)
+        return result
+
+# External method
+# Returns the number of jobs used: an explicit -jN (on the command line or in SCONSFLAGS)
+# has priority over SetOption
+def set_num_jobs(int_data, num_jobs):
+    SetOption('num_jobs', num_jobs)
+    return GetOption('num_jobs')
+
+# External method
+# compile_memory is object -> peak memory (KiB) from the earlier runs; the objects compiled
+# in this run are updated in it, and it's written to compile_memory_file at the end of the run
+def measure_compile_memory(int_data, compile_memory_file, compile_memory):
+    if int_data['env'] is not None:
+        print('measure_compile_memory WARNING: the Environment is already constructed, ' + \
+                        'compilations are not measured')
+        return
+    int_data['compile_memory'] = compile_memory
+    atexit.register(lambda: _write_compile_memory(int_data, compile_memory_file))
+
+# Internal method
+def _write_compile_memory(int_data, compile_memory_file):
+    with open(compile_memory_file + '.tmp', 'w') as opened_file:
+        json.dump(int_data['compile_memory'], opened_file, indent = 1, sort_keys = True)
+    os.replace(compile_memory_file + '.tmp', compile_memory_file)
+
+# External method
+# Returns wrappers for one configuration of a matrix build: with its own
+# Environment (cloned from this one), its own ARGUMENTS and the same dependency graph
+def new_matrix_wrappers(int_data, arguments):
+    matrix_data = _internal_data(int_data['tracer'])
+    matrix_data['base'] = int_data
+    matrix_data['arguments'] = arguments
+    matrix_data['declared_objects'] = int_data['declared_objects']
+    # The compile broker is used via SPAWN of the base Environment
+    return _ext_methods(matrix_data)
+
+# Not every compile unit of a binary has debug info (see function _has_split_dwarf)
+_SKELETON_UNITS_CHECKED = 16
+
+# The runs before the measured ones (see function _measure_startup)
+_STARTUP_WARMUP_RUNS = 10
+
+# _IOW(0x94, 9, int), see linux/fs.h
+_FICLONE = 0x40049409
 
 # ========== (DATA) CONSTRUCTOR ==========
 
-def _internal_data(variables_cache_file):
+def _internal_data(tracer):
     mydata = {
-        # 2 my own env variables are added in function read_vars_from_cache and then
-        # their values are set in function save_vars_to_cache
-        'env' : Environment(),
+        # See tracing.py
+        'tracer' : tracer,
+
+        # Constructed in function _get_env
+        'env' : None,
+        # Set in function new_matrix_wrappers
+        'base' : None,
+
+        # The target node of the command being spawned, per thread (see function _trace_builds)
+        'spawn_target' : threading.local(),
+
+        # Set in function _use_compile_broker
+        'broker' : None,
+        'broker_absent' : 0,
+
+        # Object -> peak memory of its compilation (KiB); set in function measure_compile_memory
+        'compile_memory' : None,
+
+        # Set in function set_install_mode
+        'install_mode' : 'copy',
+        'allow_hardlink' : 0,
+
+        # Object (or precompiled header) path -> nodes; is populated in function will_compile
+        'declared_objects' : {},
+
+        # See function _install_split_debug
+        'split_debug_tools' : {'objcopy' : 'objcopy', 'readelf' : 'readelf', 'dwp' : 'dwp'},
+
+        # The benchmarks share this side effect (a file that is never written),
+        # so that 'scons -jN' runs them one at a time and one doesn't load the host for the other
+        'benchmark_side_effect' : '.scons_benchmarks',
 
-        'new_env_call': lambda **kwargs: Environment(**kwargs),
+        # See function _will_precompile_headers
+        'pch_command' : '$CXX -o $TARGET -x c++-header -c $CXXFLAGS $CCFLAGS $_CCCOMCOM $SOURCE',
 
-        # This is a SCons.Variables.Variables class object for reading from /
-        # writing to the variables cache file
-        # Changed by calling method "Add" in function read_vars_from_cache
-        'scons_var_obj' : Variables(variables_cache_file),
+        # Only the tools that are really used: C++ compiler, linker, install
+        # (instead of detecting all the tools SCons knows about);
+        # can be changed by passing ENV_TOOLS=tool1,tool2 (for example ENV_TOOLS=default)
+        'env_tools' : ['g++', 'gnulink', 'install'],
 
         'arguments' : ARGUMENTS,
         'command_line_targets' : COMMAND_LINE_TARGETS,